@@ -1,13 +1,18 @@
 from flask import Flask
 from flask_login import LoginManager
 from config import Config, inject_global_template_variables
-from models import db, User
+from models import db
 from routes.auth import auth
 from routes.main import main
 from routes.bets import bets
 from routes.blockchain import blockchain_bp
 from routes.services import services
 from cli import register_cli_commands
+from storage import init_storage
+from cache import init_cache
+from identity import init_user_cache, load_user_snapshot
+from metrics import init_metrics
+from migrations import require_current_schema
 
 def create_app():
     app = Flask(__name__)
@@ -15,6 +20,11 @@ def create_app():
 
     # Initialize extensions
     db.init_app(app)
+    init_storage(app)
+    init_cache(app)
+    init_user_cache(app)
+    init_metrics(app, db)
+    app.before_request(require_current_schema)
     
     # Initialize login manager
     login_manager = LoginManager()
@@ -24,7 +34,7 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_user_snapshot(int(user_id))
 
     # Register context processor
     app.context_processor(inject_global_template_variables)
@@ -39,10 +49,6 @@ def create_app():
     # Register CLI commands
     register_cli_commands(app)
 
-    # Create tables
-    with app.app_context():
-        db.create_all()
-
     return app
 
 app = create_app()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Measure login throughput and how page latency holds up while logins are hammered.
+
+    python benchmarks/bench_auth.py --login-threads 16 --seconds 10 --rounds 12
+    python benchmarks/bench_auth.py --server dev
+
+Serves the app with gunicorn.conf.py, one worker by default, so the bcrypt
+limits are measured against a worker's GUNICORN_THREADS request threads as
+in production. --server dev uses werkzeug's threaded server instead, which
+starts a thread per request. Page latency for /services is sampled first
+on an idle server, then while login threads post valid credentials as fast
+as they can. Logins turned away by the bounded bcrypt pool are counted as
+503s.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+def post_login(base_url, email):
+    body = urllib.parse.urlencode({'email': email, 'password': 'benchmark'}).encode()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor())
+    try:
+        with opener.open(base_url + '/login', data=body) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+def sample_page(base_url, stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        with urllib.request.urlopen(base_url + '/services') as response:
+            response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.01)
+
+def wait_for(base_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            with urllib.request.urlopen(base_url + '/access', timeout=1) as response:
+                response.read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start')
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float('nan')
+
+def report(label, latencies):
+    print(f"{label:<28} page p50 {percentile(latencies, 0.5):7.1f} ms   p95 {percentile(latencies, 0.95):7.1f} ms"
+          f"   ({len(latencies)} samples)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=2, help='BCRYPT_WORKERS')
+    parser.add_argument('--queue', type=int, default=2, help='BCRYPT_QUEUE_SIZE')
+    parser.add_argument('--server', choices=['gunicorn', 'dev'], default='gunicorn')
+    parser.add_argument('--gunicorn-workers', type=int, default=1, help='GUNICORN_WORKERS')
+    parser.add_argument('--threads', type=int, default=8, help='GUNICORN_THREADS')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'BCRYPT_ROUNDS': str(args.rounds),
+            'BCRYPT_WORKERS': str(args.workers),
+            'BCRYPT_QUEUE_SIZE': str(args.queue),
+            'CACHE_BACKEND': 'null',
+            'GUNICORN_BIND': f'127.0.0.1:{args.port}',
+            'GUNICORN_WORKERS': str(args.gunicorn_workers),
+            'GUNICORN_THREADS': str(args.threads),
+            'GUNICORN_ACCESS_LOG': '',
+        })
+        from werkzeug.serving import make_server
+        from app import app
+        from models import db, User
+        import passwords
+        import migrations
+
+        with app.app_context():
+            migrations.upgrade()
+
+        with app.app_context():
+            password_hash = passwords.hash_password('benchmark')
+            db.session.bulk_insert_mappings(User, [
+                {'id': i, 'name': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash,
+                 'wins': 0, 'losses': 0, 'block_balance': 0}
+                for i in range(1, args.login_threads + 1)
+            ])
+            db.session.commit()
+
+        if args.server == 'gunicorn':
+            process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                                       cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            base_url = f'http://127.0.0.1:{args.port}'
+            wait_for(base_url, process)
+            stop_server = lambda: (process.terminate(), process.wait())
+        else:
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            stop_server = server.shutdown
+
+        stop = threading.Event()
+        idle = []
+        sampler = threading.Thread(target=sample_page, args=(base_url, stop, idle))
+        sampler.start()
+        time.sleep(min(3, args.seconds))
+        stop.set()
+        sampler.join()
+
+        statuses = []
+        stop = threading.Event()
+
+        def log_in(user_id):
+            while not stop.is_set():
+                status = post_login(base_url, f'user{user_id}@example.com')
+                statuses.append(status)
+                if status == 503:
+                    time.sleep(1)  # Honour Retry-After like a well-behaved client
+
+        loaded = []
+        threads = [threading.Thread(target=log_in, args=(user_id,)) for user_id in range(1, args.login_threads + 1)]
+        threads.append(threading.Thread(target=sample_page, args=(base_url, stop, loaded)))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stop_server()
+
+        succeeded = sum(1 for status in statuses if status < 400)
+        busy = statuses.count(503)
+        server = (f"gunicorn, {args.gunicorn_workers} workers x {args.threads} threads"
+                  if args.server == 'gunicorn' else "threaded dev server")
+        print(f"{server}; bcrypt cost {args.rounds}, {args.workers} hashing threads, queue {args.queue}, "
+              f"{args.login_threads} login clients for {elapsed:.1f}s")
+        print(f"Logins: {succeeded} ok ({succeeded / elapsed:.1f}/s), {busy} turned away with 503, "
+              f"{len(statuses) - succeeded - busy} other errors")
+        report("Idle server", idle)
+        report("During login burst", loaded)
+        if idle and loaded:
+            print(f"p50 slowdown under load: {statistics.median(loaded) / statistics.median(idle):.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Time marketplace queries (filters, search, keyset pages) against a large synthetic catalogue.
+
+    python benchmarks/bench_marketplace.py --services 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from config import Config
+from models import db, User, Service
+from marketplace import create_service_search, search_mode, search_services
+
+WORDS = ['garden', 'dinner', 'bike', 'repair', 'lesson', 'guitar', 'moving', 'help', 'dog', 'walk',
+         'coffee', 'cake', 'painting', 'tutoring', 'math', 'ride', 'airport', 'laundry', 'plants', 'cleaning']
+
+def seed(users, services):
+    db.session.bulk_insert_mappings(User, [
+        {'id': i, 'name': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+         'wins': 0, 'losses': 0, 'block_balance': 0}
+        for i in range(1, users + 1)
+    ])
+    db.session.bulk_insert_mappings(Service, [
+        {'title': ' '.join(random.sample(WORDS, 3)).capitalize(),
+         'description': ' '.join(random.choices(WORDS, k=12)),
+         'block_cost': random.randint(1, 100),
+         'provider_id': random.randint(1, users),
+         'status': 'available' if random.random() < 0.8 else 'completed'}
+        for _ in range(services)
+    ])
+    db.session.commit()
+
+def timed(label, repeat, **kwargs):
+    search_mode = kwargs.pop('search_mode')
+    started = time.perf_counter()
+    for _ in range(repeat):
+        services, cursor = search_services(search_mode, **kwargs)
+    elapsed = (time.perf_counter() - started) / repeat * 1000
+    print(f"{label:<32} {elapsed:7.2f} ms  ({len(services)} rows)")
+    return cursor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--services', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config.from_object(Config)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            create_service_search(db.session.connection())
+            seed(args.users, args.services)
+
+        with app.app_context():
+            mode = search_mode()
+            print(f"{args.services} services, text search via {mode}")
+            cursor = timed("newest, first page", args.repeat, search_mode=mode)
+            timed("newest, second page", args.repeat, search_mode=mode, after=cursor)
+            cursor = timed("cheapest, 10-20 blocks", args.repeat, search_mode=mode,
+                           sort='cost_low', min_cost=10, max_cost=20)
+            timed("cheapest, 10-20 blocks, page 2", args.repeat, search_mode=mode,
+                  sort='cost_low', min_cost=10, max_cost=20, after=cursor)
+            timed("one provider", args.repeat, search_mode=mode, provider_id=7)
+            timed("search 'guitar lesson'", args.repeat, search_mode=mode, query='guitar lesson')
+            timed("search 'guit' + max 5 blocks", args.repeat, search_mode=mode, query='guit', max_cost=5)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark the bulk migrate-to-blockchain mode on a synthetic database.
+
+    python benchmarks/bench_migration.py --users 2000 --bets 200 --wagers-per-bet 20
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from config import Config
+from models import db, User, Bet, UserBet
+from bulk_migration import migrate_bulk
+
+def seed(users, bets, wagers_per_bet):
+    db.session.bulk_insert_mappings(User, [
+        {'id': i, 'name': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+         'wins': 0, 'losses': 0, 'block_balance': 0}
+        for i in range(1, users + 1)
+    ])
+    expiration = datetime.datetime.now() + datetime.timedelta(days=7)
+    db.session.bulk_insert_mappings(Bet, [
+        {'id': i, 'title': f'Bet {i}', 'description': 'Synthetic bet', 'expiration_date': expiration,
+         'outcomes': 'yes,no', 'creator_id': random.randint(1, users),
+         'resolved': i % 2 == 0, 'winning_outcome': 'yes' if i % 2 == 0 else None}
+        for i in range(1, bets + 1)
+    ])
+    db.session.bulk_insert_mappings(UserBet, [
+        {'user_id': user_id, 'bet_id': bet_id, 'chosen_outcome': random.choice(['yes', 'no'])}
+        for bet_id in range(1, bets + 1)
+        for user_id in random.sample(range(1, users + 1), min(wagers_per_bet, users))
+    ])
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--bets', type=int, default=200)
+    parser.add_argument('--wagers-per-bet', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--block-size', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config.from_object(Config)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            seed(args.users, args.bets, args.wagers_per_bet)
+            records, blocks, elapsed = migrate_bulk(chunk_size=args.chunk_size, block_size=args.block_size)
+
+    print(f"Migrated {records} records into {blocks} blocks in {elapsed:.2f}s")
+    print(f"Throughput: {records / elapsed:.0f} records/s "
+          f"(difficulty {Config.MINING_DIFFICULTY}, block size {args.block_size})")
+
+if __name__ == '__main__':
+    main()
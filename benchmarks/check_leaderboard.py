@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Check that the in-memory leaderboard ranks users the way a full sort does.
+
+    python benchmarks/check_leaderboard.py --users 2000 --new-users 300
+
+Seeds users with few distinct records, so most of them tie, and loads the
+board. Then it signs up users one at a time that the board has not seen and
+asks for each one's rank, which places them without a reload. Every rank is
+compared with the user's position in a fresh sort of all users by most wins,
+fewest losses and user id. Finally the whole board is compared with that
+sort page by page.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def full_sort():
+    from models import db, User
+    rows = db.session.query(User.id, User.wins, User.losses).all()
+    return [user_id for user_id, _, _ in sorted(rows, key=lambda row: (-row[1], row[2], row[0]))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000, help='Users on the board when it loads.')
+    parser.add_argument('--new-users', type=int, default=300, help='Users signed up after it loaded.')
+    parser.add_argument('--max-record', type=int, default=5, help='Highest wins or losses.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'check.db')}",
+            'MINING_MODE': 'worker',
+            'LEADERBOARD_REFRESH_SECONDS': '3600',  # Never reload while the check runs
+        })
+        from app import app
+        from models import db, User
+        from leaderboard import leaderboard_cache
+        import migrations
+
+        def record():
+            return {'wins': rng.randint(0, args.max_record), 'losses': rng.randint(0, args.max_record)}
+
+        with app.app_context():
+            migrations.upgrade()
+            db.session.bulk_insert_mappings(User, [
+                {'id': i, 'name': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+                 'block_balance': 0, **record()}
+                for i in range(1, args.users + 1)
+            ])
+            db.session.commit()
+            leaderboard_cache.page(0, 1)
+
+            mismatches = []
+            started = time.perf_counter()
+            for user_id in range(args.users + 1, args.users + args.new_users + 1):
+                user = User(id=user_id, name=f'user{user_id}', email=f'user{user_id}@example.com',
+                            password_hash='x', block_balance=0, **record())
+                db.session.add(user)
+                db.session.commit()
+                ranked = leaderboard_cache.rank(user)
+                expected = full_sort().index(user_id) + 1
+                if ranked != expected:
+                    mismatches.append((user_id, ranked, expected))
+            elapsed = time.perf_counter() - started
+
+            expected_board = full_sort()
+            board = []
+            while True:
+                entries, total = leaderboard_cache.page(len(board), 500)
+                if not entries:
+                    break
+                board.extend(entry['user_id'] for entry in entries)
+
+    print(f"{args.new_users} unseen users ranked against {args.users} loaded ones in {elapsed:.2f}s")
+    for user_id, ranked, expected in mismatches[:10]:
+        print(f"  user {user_id}: ranked {ranked}, full sort gives {expected}")
+    print(f"Ranks that disagree with a full sort: {len(mismatches)}")
+    print(f"Board matches a full sort: {board == expected_board} ({total} users)")
+    if mismatches or board != expected_board:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
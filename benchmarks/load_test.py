@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Compare page throughput under gunicorn (gunicorn.conf.py) with `flask run`.
+
+    python benchmarks/load_test.py --clients 16 --seconds 15
+    python benchmarks/load_test.py --server gunicorn --workers 4 --threads 8
+
+Seeds a temporary database with users, bets, wagers and services, starts
+each server on it in turn and lets --clients logged-in clients request
+/, /leaderboard, /services, /blockchain, /bet/<id> and /api/leaderboard in
+a loop over keep-alive connections. Reports requests per second, latency
+percentiles and errors per server. Use --no-cache to measure rendering
+rather than the response cache.
+
+The clients run in this process, so on a small machine they compete with
+the server for CPU; the comparison between servers is what matters.
+"""
+import argparse
+import datetime
+import http.client
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+OUTCOMES = ['Yes', 'No', 'Maybe']
+
+def seed(users, bets, services):
+    from models import db, User, Bet, UserBet, Service
+    from bet_stats import rebuild_tallies
+    from blockchain import Blockchain
+    import passwords
+
+    Blockchain.ensure_genesis_block()
+    password_hash = passwords.hash_password('benchmark')
+    db.session.bulk_insert_mappings(User, [
+        {'id': i, 'name': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash,
+         'wins': random.randint(0, 20), 'losses': random.randint(0, 20), 'block_balance': 100}
+        for i in range(1, users + 1)
+    ])
+    expiration = datetime.datetime.now() + datetime.timedelta(days=30)
+    db.session.bulk_insert_mappings(Bet, [
+        {'id': i, 'title': f'Bet number {i}', 'description': 'Seeded for the load test',
+         'expiration_date': expiration, 'outcomes': ','.join(OUTCOMES), 'creator_id': random.randint(1, users),
+         'resolved': False}
+        for i in range(1, bets + 1)
+    ])
+    db.session.bulk_insert_mappings(UserBet, [
+        {'user_id': user_id, 'bet_id': bet_id, 'chosen_outcome': random.choice(OUTCOMES)}
+        for bet_id in range(1, bets + 1)
+        for user_id in random.sample(range(1, users + 1), min(users, 10))
+    ])
+    db.session.bulk_insert_mappings(Service, [
+        {'title': f'Service number {i}', 'description': 'Seeded for the load test',
+         'block_cost': random.randint(1, 100), 'provider_id': random.randint(1, users), 'status': 'available'}
+        for i in range(1, services + 1)
+    ])
+    rebuild_tallies()
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/access')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+def log_in(port, email):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body = urllib.parse.urlencode({'email': email, 'password': 'benchmark'})
+    connection.request('POST', '/login', body=body, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    for header, value in response.getheaders():
+        if header.lower() == 'set-cookie' and value.startswith('session='):
+            return value.split(';', 1)[0]
+    raise RuntimeError(f'login for {email} failed with status {response.status}')
+
+def client(port, cookie, paths, stop, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while not stop.is_set():
+        path = random.choice(paths)
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers={'Cookie': cookie})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException):
+            errors.append('connection')
+            connection.close()
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+    connection.close()
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float('nan')
+
+def run(name, command, env, port, args):
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port, process)
+        cookies = [log_in(port, f'user{i}@example.com') for i in range(1, args.clients + 1)]
+        paths = ['/', '/leaderboard', '/services', '/blockchain', '/api/leaderboard'] + \
+                [f'/bet/{i}' for i in random.sample(range(1, args.bets + 1), min(args.bets, 5))]
+
+        stop = threading.Event()
+        latencies = []
+        errors = []
+        threads = [threading.Thread(target=client, args=(port, cookie, paths, stop, latencies, errors))
+                   for cookie in cookies]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"{name:<10} {len(latencies) / elapsed:8.1f} req/s   p50 {percentile(latencies, 0.5):7.1f} ms"
+          f"   p95 {percentile(latencies, 0.95):7.1f} ms   p99 {percentile(latencies, 0.99):7.1f} ms"
+          f"   {len(errors)} errors")
+    return len(latencies) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', choices=['both', 'gunicorn', 'flask'], default='both')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--workers', type=int, help='GUNICORN_WORKERS; defaults to the CPU quota rule')
+    parser.add_argument('--threads', type=int, help='GUNICORN_THREADS')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--bets', type=int, default=200)
+    parser.add_argument('--services', type=int, default=1000)
+    parser.add_argument('--no-cache', action='store_true', help='Run with CACHE_BACKEND=null')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    args.users = max(args.users, args.clients)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'load.db')}",
+            'BCRYPT_ROUNDS': '4',
+            'MINING_MODE': 'worker',
+            'FLASK_APP': 'app.py',
+            'FLASK_DEBUG': '0',
+            'GUNICORN_BIND': f'127.0.0.1:{args.port}',
+            'GUNICORN_ACCESS_LOG': '',
+        })
+        if args.no_cache:
+            env['CACHE_BACKEND'] = 'null'
+        if args.workers:
+            env['GUNICORN_WORKERS'] = str(args.workers)
+        if args.threads:
+            env['GUNICORN_THREADS'] = str(args.threads)
+        os.environ.update(env)
+
+        from app import app
+        import migrations
+        with app.app_context():
+            migrations.upgrade()
+            seed(args.users, args.bets, args.services)
+
+        servers = {
+            'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+            'flask': [sys.executable, '-m', 'flask', 'run', '--port', str(args.port), '--no-reload', '--no-debugger'],
+        }
+        names = list(servers) if args.server == 'both' else [args.server]
+        print(f"{args.clients} clients for {args.seconds:.0f}s per server, "
+              f"response cache {'off' if args.no_cache else 'on'}")
+        throughput = {name: run(name, servers[name], env, args.port, args) for name in names}
+        if len(throughput) == 2 and throughput['flask']:
+            print(f"gunicorn / flask run: {throughput['gunicorn'] / throughput['flask']:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Hammer the escrow engine from many threads and check that no blocks are created or lost.
+
+    python benchmarks/stress_escrow.py --threads 16 --operations 300
+
+Buyers race to purchase, complete and cancel a small pool of services, so
+most attempts collide on the same service or the same buyer's balance.
+Afterwards the script checks that balances plus escrowed blocks equal the
+starting supply, that no balance went negative, that no service has more
+than one pending purchase, and that the ledger projection agrees with the
+user balances.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def worker(app, seed, operations, users, outcomes, lock):
+    import escrow
+    from models import db, ServiceTransaction
+    rng = random.Random(seed)
+
+    def count(outcome):
+        with lock:
+            outcomes[outcome] += 1
+
+    with app.app_context():
+        for _ in range(operations):
+            actor_id = rng.randint(1, users)
+            try:
+                roll = rng.random()
+                if roll < 0.6:
+                    escrow.purchase_service(rng.randint(1, users * 2), actor_id)
+                    count('purchased')
+                else:
+                    pending = [transaction_id for transaction_id, in
+                               db.session.query(ServiceTransaction.id).filter_by(status='pending')]
+                    if not pending:
+                        count('nothing pending')
+                        continue
+                    if roll < 0.7:
+                        escrow.complete_service(rng.choice(pending), actor_id)
+                        count('completed')
+                    else:
+                        escrow.cancel_service(rng.choice(pending), actor_id)
+                        count('cancelled')
+            except escrow.EscrowError as error:
+                count(f'refused: {error.message.split(".")[0]}')
+            finally:
+                db.session.remove()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=300, help='Attempts per thread.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--balance', type=int, default=10, help='Starting blocks per user.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'stress.db')}",
+            'MINING_MODE': 'worker',
+        })
+        from app import app
+        from models import db, User, Service, ServiceTransaction
+        import projection
+        import migrations
+
+        with app.app_context():
+            migrations.upgrade()
+
+        with app.app_context():
+            db.session.bulk_insert_mappings(User, [
+                {'id': i, 'name': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+                 'wins': 0, 'losses': 0, 'block_balance': args.balance}
+                for i in range(1, args.users + 1)
+            ])
+            db.session.bulk_insert_mappings(Service, [
+                {'id': i, 'title': f'Service {i}', 'block_cost': 1 + i % 7,
+                 'provider_id': 1 + i % args.users, 'status': 'available'}
+                for i in range(1, args.users * 2 + 1)
+            ])
+            db.session.commit()
+        supply = args.users * args.balance
+
+        outcomes = Counter()
+        lock = threading.Lock()
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(app, seed, args.operations, args.users, outcomes, lock))
+                   for seed in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            balances = db.session.query(db.func.sum(User.block_balance), db.func.min(User.block_balance)).one()
+            escrowed = (db.session.query(db.func.coalesce(db.func.sum(ServiceTransaction.blocks_spent), 0))
+                        .filter_by(status='pending').scalar())
+            double_booked = (db.session.query(ServiceTransaction.service_id)
+                             .filter_by(status='pending')
+                             .group_by(ServiceTransaction.service_id)
+                             .having(db.func.count() > 1).count())
+            # Users start with blocks the ledger never saw, so compare changes against the projection
+            drift = [(user_id, stored, projected) for user_id, stored, projected in projection.find_drift()[0]
+                     if stored is None or stored[0] - args.balance != projected[0]]
+
+        total_attempts = args.threads * args.operations
+        print(f"{total_attempts} attempts from {args.threads} threads in {elapsed:.2f}s")
+        for outcome, count in sorted(outcomes.items()):
+            print(f"  {outcome}: {count}")
+        print(f"Supply {supply}: balances {balances[0]} + escrow {escrowed} = {balances[0] + escrowed}")
+        print(f"Lowest balance: {balances[1]}")
+        print(f"Services with more than one pending purchase: {double_booked}")
+        print(f"Users whose balance disagrees with the ledger: {len(drift)}")
+        if balances[0] + escrowed != supply or balances[1] < 0 or double_booked or drift:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
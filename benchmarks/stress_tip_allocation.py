@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Stress concurrent block production and check that nothing is lost or forked.
+
+    python benchmarks/stress_tip_allocation.py --processes 8 --transactions 200
+
+Every process writes ledger transactions in inline mining mode with tiny
+blocks, so all of them keep sealing and mining on the same tip at once.
+Afterwards the script checks that every transaction landed in exactly one
+block, that block indices run 0..n without gaps and that the chain passes a
+full audit.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def writer(app, worker, transactions):
+    from models import db
+    from blockchain import Blockchain
+    with app.app_context():
+        db.engine.dispose(close=False)  # Do not share the parent's connections
+        for seq in range(transactions):
+            Blockchain.add_transaction('stress', data={'worker': worker, 'seq': seq})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--transactions', type=int, default=200, help='Transactions per process.')
+    parser.add_argument('--block-size', type=int, default=2)
+    parser.add_argument('--difficulty', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'stress.db')}",
+            'MINING_MODE': 'inline',
+            'BLOCK_MAX_TRANSACTIONS': str(args.block_size),
+            'MINING_DIFFICULTY': str(args.difficulty),
+            'BLOCK_APPEND_ATTEMPTS': '50',
+        })
+        from app import app
+        from models import db, Block, Transaction, PendingTransaction
+        from blockchain import Blockchain
+        import migrations
+
+        with app.app_context():
+            migrations.upgrade()
+
+        started = time.perf_counter()
+        ctx = multiprocessing.get_context('fork')
+        workers = [ctx.Process(target=writer, args=(app, worker, args.transactions))
+                   for worker in range(args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            Blockchain.flush_mempool()
+            expected = {(w, s) for w in range(args.processes) for s in range(args.transactions)}
+            seen = [tuple(json.loads(data).values()) for (data,) in
+                    db.session.query(Transaction.data).filter_by(transaction_type='stress')]
+            indices = [index for (index,) in db.session.query(Block.index).order_by(Block.index.asc())]
+
+            lost = len(expected - set(seen))
+            duplicated = len(seen) - len(set(seen))
+            gaps = indices != list(range(len(indices)))
+            valid = Blockchain.validate_chain(full=True)
+            leftover = PendingTransaction.query.count()
+
+    failed = [w.exitcode for w in workers if w.exitcode]
+    total = args.processes * args.transactions
+    print(f"{args.processes} processes x {args.transactions} transactions in {elapsed:.1f}s "
+          f"({total / elapsed:.0f} tx/s, {len(indices)} blocks)")
+    print(f"lost={lost} duplicated={duplicated} index_gaps={gaps} chain_valid={valid} "
+          f"left_in_mempool={leftover} failed_workers={len(failed)}")
+    if lost or duplicated or gaps or not valid or leftover or failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+from sqlalchemy import func
+from models import db, User, UserBet, BetOutcomeTally
+from storage import upsert
+
+def get_bet_statistics(bets, include_bettors=True):
+    """Compute outcome counts, percentages and bettors for a list of bets.
+
+    Counts come from the BetOutcomeTally table, so they cost one read per
+    outcome rather than a scan over every wager. With include_bettors a
+    single UserBet/User join also lists who bet on what. Returns a dict keyed
+    by bet id.
+    """
+    stats = {}
+    for bet in bets:
+        outcomes = bet.get_outcomes_list()
+        stats[bet.id] = {
+            'outcome_counts': {outcome: 0 for outcome in outcomes},
+            'outcome_percentages': {outcome: 0 for outcome in outcomes},
+            'users_by_outcome': {outcome: [] for outcome in outcomes},
+            'users_who_betted': [],
+            'total_bets': 0
+        }
+    if not stats:
+        return stats
+
+    tallies = BetOutcomeTally.query.filter(BetOutcomeTally.bet_id.in_(stats)).all()
+    for tally in tallies:
+        bet_stats = stats[tally.bet_id]
+        if tally.outcome in bet_stats['outcome_counts']:
+            bet_stats['outcome_counts'][tally.outcome] += tally.count
+        bet_stats['total_bets'] += tally.count
+
+    if include_bettors:
+        bettor_rows = (db.session.query(UserBet.bet_id, UserBet.chosen_outcome, User.id, User.name)
+                       .join(User, User.id == UserBet.user_id)
+                       .filter(UserBet.bet_id.in_(stats))
+                       .order_by(UserBet.id.asc())
+                       .all())
+        for row in bettor_rows:
+            bet_stats = stats[row.bet_id]
+            if row.chosen_outcome in bet_stats['users_by_outcome']:
+                bet_stats['users_by_outcome'][row.chosen_outcome].append(row)
+            bet_stats['users_who_betted'].append(row.name)
+
+    for bet_stats in stats.values():
+        bet_stats['users_who_betted'] = list(set(bet_stats['users_who_betted']))
+        if bet_stats['total_bets'] > 0:
+            for outcome, count in bet_stats['outcome_counts'].items():
+                bet_stats['outcome_percentages'][outcome] = (count / bet_stats['total_bets']) * 100
+
+    return stats
+
+def get_user_outcomes(user_id, bets):
+    """Map bet id to the outcome user_id chose, for the bets they joined"""
+    bet_ids = [bet.id for bet in bets]
+    if not bet_ids:
+        return {}
+    rows = (db.session.query(UserBet.bet_id, UserBet.chosen_outcome)
+            .filter(UserBet.user_id == user_id, UserBet.bet_id.in_(bet_ids))
+            .all())
+    return dict(rows)
+
+def increment_tally(bet_id, outcome):
+    """Count one more wager on outcome; call before committing the new UserBet.
+
+    One upsert statement, so the first two wagers on an outcome cannot both
+    insert its row.
+    """
+    db.session.execute(upsert(BetOutcomeTally, {'bet_id': bet_id, 'outcome': outcome, 'count': 1},
+                              index_elements=['bet_id', 'outcome'],
+                              set_={'count': BetOutcomeTally.__table__.c.count + 1}))
+
+def _counts_from_wagers():
+    rows = (db.session.query(UserBet.bet_id, UserBet.chosen_outcome, func.count(UserBet.id))
+            .group_by(UserBet.bet_id, UserBet.chosen_outcome)
+            .all())
+    return {(bet_id, outcome): count for bet_id, outcome, count in rows}
+
+def rebuild_tallies(commit=True):
+    """Recompute every tally from UserBet and return how many rows were written"""
+    counts = _counts_from_wagers()
+    BetOutcomeTally.query.delete()
+    db.session.bulk_insert_mappings(BetOutcomeTally, [
+        {'bet_id': bet_id, 'outcome': outcome, 'count': count}
+        for (bet_id, outcome), count in counts.items()
+    ])
+    if commit:
+        db.session.commit()
+    return len(counts)
+
+def find_tally_drift():
+    """List (bet_id, outcome, tallied, actual) for every tally that disagrees with UserBet"""
+    actual = _counts_from_wagers()
+    tallied = {(tally.bet_id, tally.outcome): tally.count
+               for tally in BetOutcomeTally.query.filter(BetOutcomeTally.count > 0)}
+    return [(bet_id, outcome, tallied.get((bet_id, outcome), 0), actual.get((bet_id, outcome), 0))
+            for bet_id, outcome in sorted(set(actual) | set(tallied))
+            if tallied.get((bet_id, outcome), 0) != actual.get((bet_id, outcome), 0)]
@@ -1,7 +1,22 @@
+import os
 import time
-import hashlib
 import json
-from models import db, Block, Transaction
+import random
+from flask import current_app
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models import db, Block, Transaction, PendingTransaction, MiningJob, ChainCheckpoint, MerkleTree
+import merkle
+from storage import is_database_locked
+from metrics import CHAIN_VALIDATION_SECONDS, MERKLE_BUILD_SECONDS
+
+def process_is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
 
 class Blockchain:
     @staticmethod
@@ -22,94 +37,521 @@ class Blockchain:
         """Get the most recent block in the chain"""
         return Block.query.order_by(Block.index.desc()).first()
 
+    @staticmethod
+    def get_tip_hash():
+        """Hash of the most recent block, or None for an empty chain"""
+        return db.session.query(Block.hash).order_by(Block.index.desc()).limit(1).scalar()
+
     @staticmethod
     def create_merkle_root(transactions):
         """Create a merkle root from a list of transactions"""
-        if not transactions:
-            return "0"
-        
-        transaction_hashes = [tx.hash for tx in transactions]
-        
-        while len(transaction_hashes) > 1:
-            next_level = []
-            for i in range(0, len(transaction_hashes), 2):
-                if i + 1 < len(transaction_hashes):
-                    combined = transaction_hashes[i] + transaction_hashes[i + 1]
-                else:
-                    combined = transaction_hashes[i] + transaction_hashes[i]
-                next_level.append(hashlib.sha256(combined.encode()).hexdigest())
-            transaction_hashes = next_level
-        
-        return transaction_hashes[0]
+        return Blockchain.merkle_root_from_hashes([tx.hash for tx in transactions])
 
     @staticmethod
-    def add_block(transactions):
-        """Add a new block to the blockchain with the given transactions"""
-        latest_block = Blockchain.get_latest_block()
-        if not latest_block:
-            # Create genesis block if none exists
-            genesis = Blockchain.create_genesis_block()
-            db.session.add(genesis)
+    def merkle_root_from_hashes(transaction_hashes):
+        """Create a merkle root from a list of transaction hashes"""
+        return merkle.root_of(Blockchain.build_merkle_levels(transaction_hashes))
+
+    @staticmethod
+    @MERKLE_BUILD_SECONDS.time()
+    def build_merkle_levels(transaction_hashes):
+        """merkle.build_levels, timed for /metrics"""
+        return merkle.build_levels(transaction_hashes)
+
+    @staticmethod
+    def store_merkle_tree(block, levels):
+        """Keep the tree levels of a flushed block so inclusion proofs can be served without rehashing"""
+        db.session.add(MerkleTree(block_id=block.id, levels=json.dumps(levels)))
+
+    @staticmethod
+    def get_merkle_levels(block):
+        """Return the stored tree levels of block, building and storing them for older blocks"""
+        tree = db.session.get(MerkleTree, block.id)
+        if tree:
+            return json.loads(tree.levels)
+
+        hashes = [tx_hash for tx_hash, in (db.session.query(Transaction.hash)
+                                           .filter(Transaction.block_id == block.id)
+                                           .order_by(Transaction.id.asc()))]
+        levels = Blockchain.build_merkle_levels(hashes)
+        Blockchain.store_merkle_tree(block, levels)
+        try:
             db.session.commit()
-            latest_block = genesis
+        except IntegrityError:
+            # Another request stored it first
+            db.session.rollback()
+        return levels
 
-        merkle_root = Blockchain.create_merkle_root(transactions)
-        
-        new_block = Block(
+    @staticmethod
+    def merkle_proof(tx_hash):
+        """Build the inclusion proof of a mined transaction, or None if tx_hash is not in a block"""
+        tx = Transaction.query.filter_by(hash=tx_hash).first()
+        if not tx:
+            return None
+
+        block = db.session.get(Block, tx.block_id)
+        levels = Blockchain.get_merkle_levels(block)
+        leaf_index = levels[0].index(tx_hash)
+        return {
+            'tx_hash': tx_hash,
+            'block_index': block.index,
+            'block_hash': block.hash,
+            'merkle_root': block.merkle_root,
+            'leaf_index': leaf_index,
+            'path': merkle.proof_path(levels, leaf_index)
+        }
+
+    @staticmethod
+    def ensure_genesis_block():
+        """Create the genesis block if the chain is empty"""
+        if Blockchain.get_latest_block():
+            return
+        db.session.add(Blockchain.create_genesis_block())
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another process created it first
+            db.session.rollback()
+
+    @staticmethod
+    def next_block(merkle_root):
+        """An unsaved, unmined block with merkle_root on top of the current tip"""
+        Blockchain.ensure_genesis_block()
+        latest_block = Blockchain.get_latest_block()
+
+        return Block(
             index=latest_block.index + 1,
             timestamp=time.time(),
             previous_hash=latest_block.hash,
             merkle_root=merkle_root,
             nonce=0
         )
-        
-        new_block.mine_block(difficulty=4)
-        db.session.add(new_block)
-        db.session.flush()  # Get the block ID
-        
-        # Assign transactions to this block
-        for tx in transactions:
-            tx.block_id = new_block.id
-            db.session.add(tx)
-        
-        db.session.commit()
+
+    @staticmethod
+    def mine(block):
+        """Search for block's nonce at the configured difficulty; touches no database"""
+        block.mine_block(difficulty=current_app.config['MINING_DIFFICULTY'],
+                         workers=current_app.config['MINING_WORKERS'])
+
+    @staticmethod
+    def mine_next_block(merkle_root):
+        """Mine an unsaved block with merkle_root on top of the current tip"""
+        new_block = Blockchain.next_block(merkle_root)
+        Blockchain.mine(new_block)
         return new_block
 
     @staticmethod
-    def validate_chain():
-        """Validate the entire blockchain"""
-        blocks = Block.query.order_by(Block.index.asc()).all()
-        
-        for i in range(1, len(blocks)):
-            current_block = blocks[i]
-            previous_block = blocks[i - 1]
-            
-            # Check if current block's hash is valid
-            if current_block.hash != current_block.calculate_hash():
-                return False
-            
-            # Check if current block points to previous block
-            if current_block.previous_hash != previous_block.hash:
-                return False
-            
-            # Validate merkle root
-            block_transactions = Transaction.query.filter_by(block_id=current_block.id).all()
-            if current_block.merkle_root != Blockchain.create_merkle_root(block_transactions):
-                return False
-        
+    def add_block(transactions):
+        """Add a new block to the blockchain with the given transactions"""
+        return Blockchain.append_block(lambda: transactions)
+
+    @staticmethod
+    def append_block(stage_transactions, claim=None):
+        """Mine and commit a block on the current tip, retrying if another writer wins the tip.
+
+        stage_transactions() only reads: it returns the transactions to
+        include, or None if there is nothing left to write. The read
+        transaction is then closed, so the proof-of-work search holds no
+        database lock. Afterwards one short write transaction runs claim(),
+        if given, to remove the staged work from its queue (it returns False
+        when another miner already committed it), inserts the block and its
+        transactions, and commits.
+
+        Block.index is unique, so when two processes mine on the same parent
+        only the first commit succeeds. The loser rolls back, restages and
+        re-mines on the new tip. A write that times out on a SQLite lock is
+        rolled back and retried after a randomised backoff; if the tip has
+        not moved by then, the nonce already found is reused.
+        """
+        Blockchain.ensure_genesis_block()
+        attempts = current_app.config['BLOCK_APPEND_ATTEMPTS']
+        mined = {}
+        for attempt in range(attempts):
+            transactions = stage_transactions()
+            if transactions is None:
+                db.session.rollback()
+                return None
+
+            levels = Blockchain.build_merkle_levels([tx.hash for tx in transactions])
+            new_block = Blockchain.next_block(merkle.root_of(levels))
+            db.session.commit()  # End the read transaction before the long search
+            header = (new_block.index, new_block.previous_hash, new_block.merkle_root)
+            if header in mined:
+                new_block.timestamp, new_block.nonce, new_block.hash = mined[header]
+            else:
+                Blockchain.mine(new_block)
+                mined[header] = (new_block.timestamp, new_block.nonce, new_block.hash)
+
+            try:
+                if claim is not None and not claim():
+                    db.session.rollback()
+                    return None
+                db.session.add(new_block)
+                db.session.flush()  # Get the block ID
+                Blockchain.store_merkle_tree(new_block, levels)
+
+                # Assign transactions to this block
+                for tx in transactions:
+                    tx.block_id = new_block.id
+                    db.session.add(tx)
+
+                db.session.commit()
+                return new_block
+            except IntegrityError:
+                db.session.rollback()
+            except OperationalError as error:
+                db.session.rollback()
+                if not is_database_locked(error):
+                    raise
+                time.sleep(random.uniform(0, min(2.0, 0.05 * 2 ** attempt)))
+        raise RuntimeError(f"Could not append a block after {attempts} attempts; "
+                           "the chain tip kept moving or the database stayed locked")
+
+    @staticmethod
+    def validate_chain(full=False):
+        """Validate the blockchain.
+
+        By default only blocks above the stored checkpoint are checked, and the
+        checkpoint then moves up to the new tip. full=True re-audits every block
+        from genesis, which is what `flask validate-chain --full` runs.
+        """
+        # Timed here rather than on _validate_chain, which calls itself when it falls back to a full audit
+        with CHAIN_VALIDATION_SECONDS.time():
+            return Blockchain._validate_chain(full)
+
+    @staticmethod
+    def _validate_chain(full):
+        checkpoint = None if full else ChainCheckpoint.query.get(1)
+        if checkpoint:
+            previous_block = Block.query.filter_by(index=checkpoint.block_index).first()
+            if not previous_block or previous_block.hash != checkpoint.block_hash:
+                # The checkpointed block itself changed, so nothing above it can be trusted
+                return Blockchain._validate_chain(full=True)
+        else:
+            previous_block = Block.query.filter_by(index=0).first()
+            if not previous_block:
+                return True
+
+        batch_size = 500
+        while True:
+            blocks = (Block.query
+                      .filter(Block.index > previous_block.index)
+                      .order_by(Block.index.asc())
+                      .limit(batch_size)
+                      .all())
+            if not blocks:
+                break
+
+            transactions_by_block = {block.id: [] for block in blocks}
+            block_transactions = (Transaction.query
+                                  .filter(Transaction.block_id.in_(transactions_by_block))
+                                  .order_by(Transaction.id.asc())
+                                  .all())
+            for tx in block_transactions:
+                transactions_by_block[tx.block_id].append(tx)
+
+            for current_block in blocks:
+                # Check if current block's hash is valid
+                if current_block.hash != current_block.calculate_hash():
+                    return False
+
+                # Check if current block points to previous block
+                if current_block.previous_hash != previous_block.hash:
+                    return False
+
+                # Validate merkle root
+                if current_block.merkle_root != Blockchain.create_merkle_root(transactions_by_block[current_block.id]):
+                    return False
+
+                previous_block = current_block
+
+        Blockchain.save_checkpoint(previous_block)
         return True
 
     @staticmethod
-    def add_transaction(transaction_type, user_id=None, bet_id=None, data=None):
-        """Create and add a transaction to pending transactions"""
-        transaction = Transaction(
+    def save_checkpoint(block):
+        """Record block as the highest validated block"""
+        checkpoint = ChainCheckpoint.query.get(1)
+        if checkpoint and checkpoint.block_index == block.index and checkpoint.block_hash == block.hash:
+            return
+        if not checkpoint:
+            checkpoint = ChainCheckpoint(id=1)
+            db.session.add(checkpoint)
+        checkpoint.block_index = block.index
+        checkpoint.block_hash = block.hash
+        checkpoint.validated_at = time.time()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request stored the first checkpoint at the same moment
+            db.session.rollback()
+
+    @staticmethod
+    def find_transactions(user_id=None, bet_id=None, transaction_type=None, before=None, limit=50):
+        """Return one page of mined transactions, newest first, plus whether older ones exist.
+
+        Pages are keyed on Transaction.id: pass the last id of a page as
+        before= to get the next one. Each filter is served by a composite
+        (column, id) index, so a page costs the same however large the ledger is.
+        """
+        query = db.session.query(Transaction, Block.index).join(Block, Block.id == Transaction.block_id)
+        if user_id is not None:
+            query = query.filter(Transaction.user_id == user_id)
+        if bet_id is not None:
+            query = query.filter(Transaction.bet_id == bet_id)
+        if transaction_type is not None:
+            query = query.filter(Transaction.transaction_type == transaction_type)
+        if before is not None:
+            query = query.filter(Transaction.id < before)
+
+        rows = query.order_by(Transaction.id.desc()).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+
+    @staticmethod
+    def export_ndjson(batch_size=1000):
+        """Yield the chain as NDJSON, one block per line in index order.
+
+        Rows are streamed from the database in yield_per batches and each
+        transaction's stored JSON is written out verbatim, so memory stays flat
+        however long the chain grows.
+        """
+        rows = (db.session.query(Block.index, Block.timestamp, Block.previous_hash, Block.hash,
+                                 Block.nonce, Block.merkle_root, Transaction.hash,
+                                 Transaction.transaction_type, Transaction.user_id,
+                                 Transaction.bet_id, Transaction.data, Transaction.timestamp)
+                .outerjoin(Transaction, Transaction.block_id == Block.id)
+                .order_by(Block.index.asc(), Transaction.id.asc())
+                .yield_per(batch_size))
+
+        def block_line(header, transactions):
+            # Splice the transaction list into the encoded header without re-encoding tx data
+            return json.dumps(header)[:-1] + ', "transactions": [' + ', '.join(transactions) + ']}\n'
+
+        header = None
+        transactions = []
+        for (index, timestamp, previous_hash, block_hash, nonce, merkle_root,
+             tx_hash, tx_type, tx_user_id, tx_bet_id, tx_data, tx_timestamp) in rows:
+            if header is None or header['index'] != index:
+                if header is not None:
+                    yield block_line(header, transactions)
+                header = {
+                    'index': index,
+                    'timestamp': timestamp,
+                    'previous_hash': previous_hash,
+                    'hash': block_hash,
+                    'nonce': nonce,
+                    'merkle_root': merkle_root
+                }
+                transactions = []
+            if tx_hash is not None:
+                transactions.append(
+                    f'{{"hash": {json.dumps(tx_hash)}, "type": {json.dumps(tx_type)}, '
+                    f'"user_id": {json.dumps(tx_user_id)}, "bet_id": {json.dumps(tx_bet_id)}, '
+                    f'"data": {tx_data}, "timestamp": {json.dumps(tx_timestamp)}}}'
+                )
+
+        if header is not None:
+            yield block_line(header, transactions)
+
+    @staticmethod
+    def add_transaction(transaction_type, user_id=None, bet_id=None, data=None, commit=True):
+        """Create a transaction and queue it in the mempool.
+
+        With commit=False the transaction is only staged in the session, so it
+        lands in the same commit as the caller's own changes; call
+        build_blocks() once that commit is done.
+        """
+        transaction = PendingTransaction(
             transaction_type=transaction_type,
             user_id=user_id,
             bet_id=bet_id,
             data=json.dumps(data) if data else "{}"
         )
-        
-        # For simplicity, we'll immediately create a block for each transaction
-        # In a real blockchain, transactions would be batched
-        Blockchain.add_block([transaction])
-        return transaction
\ No newline at end of file
+        db.session.add(transaction)
+        if commit:
+            db.session.commit()
+            Blockchain.build_blocks()
+        return transaction
+
+    @staticmethod
+    def build_blocks():
+        """Seal whatever the mempool has due and, in inline mode, mine it now.
+
+        Runs after the caller's own commit, so a SQLite lock timeout here is
+        logged rather than raised: the transactions are safe in the mempool
+        and the next write or the miner seals them.
+        """
+        try:
+            Blockchain.seal_due_blocks()
+            if current_app.config['MINING_MODE'] == 'inline':
+                Blockchain.mine_queued_jobs()
+        except OperationalError as error:
+            db.session.rollback()
+            if not is_database_locked(error):
+                raise
+            current_app.logger.warning('Block building deferred, the database is locked: %s', error.orig)
+
+    @staticmethod
+    def unsealed_transactions():
+        return PendingTransaction.query.filter(PendingTransaction.job_id.is_(None))
+
+    @staticmethod
+    def mempool_is_due():
+        """Check whether the mempool has hit the block size or age limit"""
+        pending_count = Blockchain.unsealed_transactions().count()
+        if not pending_count:
+            return False
+        if pending_count >= current_app.config['BLOCK_MAX_TRANSACTIONS']:
+            return True
+
+        oldest = Blockchain.unsealed_transactions().order_by(PendingTransaction.id.asc()).first()
+        if not oldest:
+            return False  # Sealed by another process since the count
+        return time.time() - oldest.timestamp >= current_app.config['BLOCK_MAX_SECONDS']
+
+    @staticmethod
+    def seal_block():
+        """Seal the oldest pending transactions into a mining job"""
+        while True:
+            pending_ids = [tx_id for (tx_id,) in (Blockchain.unsealed_transactions()
+                                                  .with_entities(PendingTransaction.id)
+                                                  .order_by(PendingTransaction.id.asc())
+                                                  .limit(current_app.config['BLOCK_MAX_TRANSACTIONS']))]
+            if not pending_ids:
+                return None
+
+            job = MiningJob(created_at=time.time())
+            db.session.add(job)
+            db.session.flush()
+            # Only claim rows no concurrent sealer has taken in the meantime
+            claimed = (PendingTransaction.query
+                       .filter(PendingTransaction.id.in_(pending_ids), PendingTransaction.job_id.is_(None))
+                       .update({'job_id': job.id}, synchronize_session=False))
+            if claimed:
+                db.session.commit()
+                return job
+            db.session.rollback()
+
+    @staticmethod
+    def seal_due_blocks():
+        """Seal jobs for as long as the mempool is over its size or age limit"""
+        jobs = []
+        while Blockchain.mempool_is_due():
+            jobs.append(Blockchain.seal_block())
+        return jobs
+
+    @staticmethod
+    def requeue_stale_jobs():
+        """Hand jobs back to the queue once they were claimed MINER_LEASE_SECONDS ago.
+
+        Nothing renews a claim, so the lease must outlast mining one block at
+        the configured difficulty. A job is mined and removed in a single
+        commit, so a job still marked 'mining' after that belongs to a miner
+        that crashed or was killed mid-search and is safe to mine again from
+        scratch. Should a slow miner still be working on it, only one of the
+        two commits wins.
+        """
+        cutoff = time.time() - current_app.config['MINER_LEASE_SECONDS']
+        requeued = (MiningJob.query
+                    .filter(MiningJob.status == 'mining', MiningJob.claimed_at < cutoff)
+                    .update({'status': 'queued', 'claimed_at': None, 'worker_id': None},
+                            synchronize_session=False))
+        db.session.commit()
+        return requeued
+
+    @staticmethod
+    def requeue_orphaned_jobs(host):
+        """Hand back jobs claimed by miners on host that are no longer running.
+
+        Worker ids are "<host>:<pid>". Call this when a miner starts, before it
+        claims anything: a job under the starting miner's own pid was left by
+        an earlier process that had the same pid. Jobs of miners on other
+        hosts wait for the lease instead.
+        """
+        requeued = 0
+        for job in MiningJob.query.filter_by(status='mining').all():
+            job_host, _, pid = (job.worker_id or '').rpartition(':')
+            if job_host != host or not pid.isdigit():
+                continue
+            if int(pid) != os.getpid() and process_is_running(int(pid)):
+                continue
+            requeued += (MiningJob.query
+                         .filter_by(id=job.id, status='mining', worker_id=job.worker_id)
+                         .update({'status': 'queued', 'claimed_at': None, 'worker_id': None},
+                                 synchronize_session=False))
+        db.session.commit()
+        return requeued
+
+    @staticmethod
+    def claim_next_job(worker_id):
+        """Mark the oldest queued job as being mined by this worker"""
+        job = MiningJob.query.filter_by(status='queued').order_by(MiningJob.id.asc()).first()
+        if not job:
+            return None
+
+        claimed = (MiningJob.query
+                   .filter_by(id=job.id, status='queued')
+                   .update({'status': 'mining', 'claimed_at': time.time(), 'worker_id': worker_id,
+                            'attempts': MiningJob.attempts + 1},
+                           synchronize_session=False))
+        db.session.commit()
+        if not claimed:
+            return None
+        db.session.refresh(job)
+        return job
+
+    @staticmethod
+    def mine_job(job):
+        """Mine a claimed job into the chain and drop it from the queue.
+
+        Returns None if another miner committed the job first, which happens
+        when a lease expired while the original miner was still working.
+        """
+        job_id = job.id
+
+        def stage_job():
+            if not db.session.get(MiningJob, job_id):
+                return None
+            pending = (PendingTransaction.query.filter_by(job_id=job_id)
+                       .order_by(PendingTransaction.id.asc()).all())
+            return [tx.to_transaction() for tx in pending]
+
+        def claim_job():
+            # Deleted in the same commit as the new block
+            PendingTransaction.query.filter_by(job_id=job_id).delete()
+            return MiningJob.query.filter_by(id=job_id).delete() > 0
+
+        return Blockchain.append_block(stage_job, claim_job)
+
+    @staticmethod
+    def release_job(job_id):
+        """Put a job this process claimed but could not finish back in the queue"""
+        db.session.rollback()
+        (MiningJob.query
+         .filter_by(id=job_id, status='mining')
+         .update({'status': 'queued', 'claimed_at': None, 'worker_id': None}, synchronize_session=False))
+        db.session.commit()
+
+    @staticmethod
+    def mine_queued_jobs(worker_id='inline'):
+        """Mine every queued job in order"""
+        blocks = []
+        while True:
+            job = Blockchain.claim_next_job(worker_id)
+            if not job:
+                return blocks
+            job_id = job.id
+            try:
+                block = Blockchain.mine_job(job)
+            except Exception:
+                Blockchain.release_job(job_id)
+                raise
+            if block:
+                blocks.append(block)
+
+    @staticmethod
+    def flush_mempool():
+        """Seal and mine every pending transaction regardless of the limits"""
+        while Blockchain.seal_block():
+            pass
+        return Blockchain.mine_queued_jobs()
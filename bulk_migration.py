@@ -0,0 +1,191 @@
+import datetime
+import json
+import time
+from models import db, User, Bet, UserBet, Transaction, MigrationCursor
+from blockchain import Blockchain
+import merkle
+
+def _user_registrations(after_id, limit):
+    rows = (db.session.query(User.id, User.name, User.email)
+            .filter(User.id > after_id).order_by(User.id.asc()).limit(limit).all())
+    return [(user_id, {
+        'transaction_type': 'user_registration',
+        'user_id': user_id,
+        'data': {
+            'name': name,
+            'email': email,
+            'registration_time': datetime.datetime.now().isoformat(),
+            'migrated': True
+        }
+    }) for user_id, name, email in rows]
+
+def _bet_creations(after_id, limit):
+    bets = Bet.query.filter(Bet.id > after_id).order_by(Bet.id.asc()).limit(limit).all()
+    return [(bet.id, {
+        'transaction_type': 'bet_creation',
+        'user_id': bet.creator_id,
+        'bet_id': bet.id,
+        'data': {
+            'title': bet.title,
+            'description': bet.description,
+            'expiration_date': bet.expiration_date.isoformat(),
+            'outcomes': bet.get_outcomes_list(),
+            'creator_id': bet.creator_id,
+            'creation_time': datetime.datetime.now().isoformat(),
+            'migrated': True
+        }
+    }) for bet in bets]
+
+def _bet_placements(after_id, limit):
+    rows = (db.session.query(UserBet.id, UserBet.user_id, UserBet.bet_id, UserBet.chosen_outcome, Bet.title)
+            .outerjoin(Bet, Bet.id == UserBet.bet_id)
+            .filter(UserBet.id > after_id).order_by(UserBet.id.asc()).limit(limit).all())
+    return [(user_bet_id, {
+        'transaction_type': 'bet_placement',
+        'user_id': user_id,
+        'bet_id': bet_id,
+        'data': {
+            'user_id': user_id,
+            'bet_id': bet_id,
+            'chosen_outcome': chosen_outcome,
+            'bet_title': title if title is not None else 'Unknown',
+            'placement_time': datetime.datetime.now().isoformat(),
+            'migrated': True
+        }
+    }) for user_bet_id, user_id, bet_id, chosen_outcome, title in rows]
+
+def _bet_resolutions(after_id, limit):
+    bets = (Bet.query.filter(Bet.resolved.is_(True), Bet.id > after_id)
+            .order_by(Bet.id.asc()).limit(limit).all())
+    if not bets:
+        return []
+
+    participants = {bet.id: [] for bet in bets}
+    rows = (db.session.query(UserBet.bet_id, User.id, User.name, UserBet.chosen_outcome)
+            .join(User, User.id == UserBet.user_id)
+            .filter(UserBet.bet_id.in_(participants))
+            .order_by(UserBet.id.asc()).all())
+    for bet_id, user_id, name, chosen_outcome in rows:
+        participants[bet_id].append({'user_id': user_id, 'name': name, 'chosen_outcome': chosen_outcome})
+
+    records = []
+    for bet in bets:
+        records.append((bet.id, {
+            'transaction_type': 'bet_resolution',
+            'user_id': bet.creator_id,
+            'bet_id': bet.id,
+            'data': {
+                'bet_id': bet.id,
+                'bet_title': bet.title,
+                'winning_outcome': bet.winning_outcome,
+                'resolver_id': bet.creator_id,
+                'winners': [p for p in participants[bet.id] if p['chosen_outcome'] == bet.winning_outcome],
+                'losers': [p for p in participants[bet.id] if p['chosen_outcome'] != bet.winning_outcome],
+                'resolution_time': datetime.datetime.now().isoformat(),
+                'migrated': True
+            }
+        }))
+    return records
+
+# Same order as the record-by-record migration so both produce the same ledger
+STAGES = [
+    ('user_registrations', _user_registrations),
+    ('bet_creations', _bet_creations),
+    ('bet_placements', _bet_placements),
+    ('bet_resolutions', _bet_resolutions),
+]
+
+def migration_state():
+    """'fresh' before any bulk run, 'partial' while stages remain, 'done' afterwards"""
+    cursors = {cursor.stage: cursor for cursor in MigrationCursor.query.all()}
+    if not cursors:
+        return 'fresh'
+    if all(stage in cursors and cursors[stage].completed for stage, _ in STAGES):
+        return 'done'
+    return 'partial'
+
+def _write_block(records, cursor_positions):
+    """Mine one block holding records and advance the stage cursors in the same commit"""
+    mappings = []
+    for record in records:
+        data = json.dumps(record['data'])
+        timestamp = time.time()
+        mappings.append({
+            'transaction_type': record['transaction_type'],
+            'user_id': record.get('user_id'),
+            'bet_id': record.get('bet_id'),
+            'data': data,
+            'timestamp': timestamp,
+            'hash': Transaction.hash_fields(record['transaction_type'], record.get('user_id'),
+                                            record.get('bet_id'), data, timestamp)
+        })
+
+    levels = Blockchain.build_merkle_levels([m['hash'] for m in mappings])
+    block = Blockchain.mine_next_block(merkle.root_of(levels))
+    db.session.add(block)
+    db.session.flush()  # Get the block ID
+    Blockchain.store_merkle_tree(block, levels)
+    for mapping in mappings:
+        mapping['block_id'] = block.id
+    db.session.bulk_insert_mappings(Transaction, mappings)
+
+    for stage, last_source_id in cursor_positions.items():
+        cursor = db.session.get(MigrationCursor, stage)
+        cursor.last_source_id = last_source_id
+    db.session.commit()
+    return block
+
+def migrate_bulk(chunk_size=1000, block_size=500, progress=None):
+    """Migrate historical records into large blocks, resuming where a previous run stopped.
+
+    Source tables are read in keyset chunks of chunk_size rows and packed
+    into blocks of block_size transactions, each written with one bulk
+    insert. Per-table cursors are committed together with every block, so an
+    interrupted run neither loses nor duplicates records when restarted.
+    progress, if given, is called after each block with
+    (stage, records_so_far, elapsed_seconds). Returns (records, blocks, seconds).
+    """
+    for stage, _ in STAGES:
+        if not db.session.get(MigrationCursor, stage):
+            db.session.add(MigrationCursor(stage=stage, last_source_id=0, completed=False))
+    db.session.commit()
+
+    started = time.perf_counter()
+    records_written = 0
+    blocks_written = 0
+    batch = []
+    positions = {}
+
+    def flush_batch():
+        nonlocal batch, positions, records_written, blocks_written
+        _write_block(batch, positions)
+        records_written += len(batch)
+        blocks_written += 1
+        batch, positions = [], {}
+        if progress:
+            progress(stage, records_written, time.perf_counter() - started)
+
+    for stage, load_chunk in STAGES:
+        cursor = db.session.get(MigrationCursor, stage)
+        if cursor.completed:
+            continue
+
+        after_id = cursor.last_source_id
+        while True:
+            chunk = load_chunk(after_id, chunk_size)
+            for source_id, record in chunk:
+                batch.append(record)
+                positions[stage] = source_id
+                if len(batch) >= block_size:
+                    flush_batch()
+            if len(chunk) < chunk_size:
+                break
+            after_id = chunk[-1][0]
+
+        if batch:
+            flush_batch()
+        cursor = db.session.get(MigrationCursor, stage)
+        cursor.completed = True
+        db.session.commit()
+
+    return records_written, blocks_written, time.perf_counter() - started
@@ -0,0 +1,155 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from werkzeug.utils import import_string
+from models import db, CacheNamespace
+from storage import upsert
+
+class MemoryCache:
+    """In-process LRU cache whose entries expire ttl seconds after they are set.
+
+    Each worker process has its own copy. That is safe for cached() pages,
+    whose keys include the namespace versions kept in the database, but
+    anything else stored here is only as fresh as ttl across processes.
+    """
+
+    def __init__(self, max_entries=2048, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class NullCache:
+    """Backend that stores nothing, for turning caching off"""
+
+    def __init__(self, max_entries=None, ttl=None):
+        pass
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+# CACHE_BACKEND is one of these names or the import path of a class with the same interface
+BACKENDS = {
+    'memory': MemoryCache,
+    'null': NullCache,
+}
+
+def init_cache(app):
+    """Create the response cache backend named by CACHE_BACKEND"""
+    backend = app.config['CACHE_BACKEND']
+    backend_class = BACKENDS.get(backend) or import_string(backend)
+    app.extensions['response_cache'] = backend_class(max_entries=app.config['CACHE_MAX_ENTRIES'],
+                                                     ttl=app.config['CACHE_TTL_SECONDS'])
+
+def get_cache():
+    return current_app.extensions['response_cache']
+
+def namespace_versions(namespaces):
+    """Current version of each namespace, read from the database so every worker sees the same ones.
+
+    A namespace that was never invalidated has version '0'.
+    """
+    if not namespaces:
+        return []
+    stored = dict(db.session.query(CacheNamespace.name, CacheNamespace.version)
+                  .filter(CacheNamespace.name.in_(namespaces)))
+    return [stored.get(namespace, '0') for namespace in namespaces]
+
+def invalidate(*namespaces):
+    """Drop every cached page that depends on any of namespaces, in every worker process.
+
+    Commits; call it after the write that made the pages stale has committed.
+    """
+    for namespace in namespaces:
+        version = uuid.uuid4().hex
+        db.session.execute(upsert(CacheNamespace, {'name': namespace, 'version': version},
+                                  index_elements=['name'], set_={'version': version}))
+    db.session.commit()
+
+def _viewer():
+    if current_user.is_authenticated:
+        # Pages show the viewer's balance in the navbar
+        return ('user', current_user.id, current_user.block_balance)
+    return ('anonymous', bool(session.get('has_passed_gate')))
+
+def cached(*namespaces, vary=None):
+    """Serve a GET view from the response cache until one of namespaces is invalidated.
+
+    Namespaces may refer to the view's URL arguments, e.g. 'bet:{bet_id}'.
+    Entries are keyed by endpoint, URL and query arguments, the viewer, the
+    namespace versions and vary(), if given. Only 200 responses are stored.
+    Requests with a pending flash message skip the cache, since rendering
+    consumes it. Every response carries an ETag and Last-Modified, and a
+    matching conditional request gets a 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(**view_args)
+
+            backend = get_cache()
+            versions = namespace_versions([namespace.format(**view_args) for namespace in namespaces])
+            key_parts = (request.endpoint, sorted(view_args.items()), sorted(request.args.items(multi=True)),
+                         _viewer(), versions, vary() if vary else None)
+            key = 'view:' + hashlib.sha1(repr(key_parts).encode()).hexdigest()
+
+            entry = backend.get(key)
+            if entry is None:
+                response = make_response(view(**view_args))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = (body, response.mimetype, hashlib.sha1(body).hexdigest(), int(time.time()))
+                backend.set(key, entry)
+
+            body, mimetype, etag, last_modified = entry
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
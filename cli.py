@@ -1,19 +1,160 @@
 import datetime
+import os
+import signal
+import socket
+import time
 import click
 from flask import current_app
-from models import db, User, Bet, UserBet, Block, Transaction
+from sqlalchemy.exc import OperationalError
+from models import db, User, Bet, UserBet, Block, Transaction, PendingTransaction, ChainCheckpoint
 from blockchain import Blockchain
+from bet_stats import rebuild_tallies, find_tally_drift
+from bulk_migration import migrate_bulk, migration_state
+import projection
+import migrations
+from storage import is_database_locked
+from metrics import registry as metrics_registry
 
 def register_cli_commands(app):
     @app.cli.command("init-db")
     def init_db_command():
-        """Clear existing data and create new tables."""
+        """Create the tables and apply any pending schema migrations."""
         with app.app_context():
-            db.create_all()
+            migrations.upgrade()
         click.echo("Initialized the database.")
 
+    @app.cli.command("flush-mempool")
+    def flush_mempool_command():
+        """Seal all pending transactions into blocks."""
+        with app.app_context():
+            pending = PendingTransaction.query.count()
+            blocks = Blockchain.flush_mempool()
+            click.echo(f"Sealed {pending} pending transactions into {len(blocks)} blocks.")
+
+    @app.cli.command("validate-chain")
+    @click.option("--full", is_flag=True, help="Re-audit every block instead of resuming from the checkpoint.")
+    def validate_chain_command(full):
+        """Check block hashes, links and merkle roots."""
+        with app.app_context():
+            valid = Blockchain.validate_chain(full=full)
+            checkpoint = ChainCheckpoint.query.get(1)
+            click.echo(f"Chain is valid: {valid}")
+            if checkpoint:
+                click.echo(f"Validated up to block #{checkpoint.block_index}.")
+
+    @app.cli.command("export-chain")
+    @click.option("--output", "-o", default="-", help="File to write to (defaults to stdout).")
+    @click.option("--batch-size", default=1000, show_default=True, help="Rows fetched per database round-trip.")
+    def export_chain_command(output, batch_size):
+        """Export the blockchain as NDJSON, one block per line."""
+        with app.app_context():
+            with click.open_file(output, "w") as out:
+                for line in Blockchain.export_ndjson(batch_size=batch_size):
+                    out.write(line)
+
+    @app.cli.command("rebuild-tallies")
+    def rebuild_tallies_command():
+        """Recompute per-outcome bet tallies from placed bets."""
+        with app.app_context():
+            rows = rebuild_tallies()
+            click.echo(f"Rebuilt {rows} outcome tallies.")
+
+    @app.cli.command("check-tallies")
+    def check_tallies_command():
+        """Compare per-outcome bet tallies with placed bets."""
+        with app.app_context():
+            drift = find_tally_drift()
+            for bet_id, outcome, tallied, actual in drift:
+                click.echo(f"Bet {bet_id} outcome '{outcome}': tallied {tallied}, actual {actual}")
+            if drift:
+                raise click.ClickException(f"{len(drift)} outcome tallies are out of date; run 'flask rebuild-tallies'.")
+            click.echo("Outcome tallies are consistent.")
+
+    @app.cli.command("reconcile")
+    @click.option("--full", is_flag=True, help="Replay the whole chain instead of starting from the latest snapshot.")
+    def reconcile_command(full):
+        """Compare user balances and win/loss records with the ledger."""
+        with app.app_context():
+            started = time.perf_counter()
+            if not full:
+                projection.catch_up()
+            drift, start_index, tip_index = projection.find_drift(full=full)
+            origin = "genesis" if start_index < 0 else f"the snapshot at block #{start_index}"
+            click.echo(f"Projected balances up to block #{tip_index} and the mempool from {origin} "
+                       f"in {time.perf_counter() - started:.2f}s.")
+            for user_id, stored, projected in drift:
+                stored_text = "no user row" if stored is None else "balance {}, wins {}, losses {}".format(*stored)
+                click.echo(f"User {user_id}: stored {stored_text}; "
+                           "ledger balance {}, wins {}, losses {}".format(*projected))
+            if drift:
+                raise click.ClickException(f"{len(drift)} users disagree with the ledger.")
+            click.echo("Balances and records match the ledger.")
+
+    @app.cli.command("run-miner")
+    @click.option("--once", is_flag=True, help="Mine whatever is queued, then exit.")
+    def run_miner_command(once):
+        """Seal the mempool and mine queued blocks outside the web workers."""
+        host = socket.gethostname()
+        worker_id = f"{host}:{os.getpid()}"
+        stopping = []
+
+        def request_stop(signum, frame):
+            click.echo("Stop requested, finishing the current block...")
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        with app.app_context():
+            poll_seconds = current_app.config['MINER_POLL_SECONDS']
+            click.echo(f"Miner {worker_id} started.")
+            orphaned = Blockchain.requeue_orphaned_jobs(host)
+            if orphaned:
+                click.echo(f"Requeued {orphaned} jobs left by stopped miners on this host.")
+            while not stopping:
+                try:
+                    requeued = Blockchain.requeue_stale_jobs()
+                    if requeued:
+                        click.echo(f"Requeued {requeued} abandoned jobs.")
+
+                    Blockchain.seal_due_blocks()
+                    job = Blockchain.claim_next_job(worker_id)
+                    if job:
+                        job_id = job.id
+                        try:
+                            block = Blockchain.mine_job(job)
+                        except Exception as error:
+                            # Hand the job straight back instead of leaving it claimed until the lease expires
+                            Blockchain.release_job(job_id)
+                            if isinstance(error, OperationalError):
+                                raise
+                            current_app.logger.exception("Job %s failed and was requeued", job_id)
+                        else:
+                            if block:
+                                click.echo(f"Mined block #{block.index} from job {job_id}.")
+                                if projection.catch_up():
+                                    click.echo(f"Snapshotted balances at block #{block.index}.")
+                            else:
+                                click.echo(f"Job {job_id} was already mined by another miner.")
+                            continue
+                except OperationalError as error:
+                    db.session.rollback()
+                    if not is_database_locked(error):
+                        raise
+                    click.echo(f"Database locked, retrying in {poll_seconds}s: {error.orig}")
+
+                db.session.remove()
+                metrics_registry.flush()  # Publish the last block's timings while idle
+                if once:
+                    break
+                time.sleep(poll_seconds)
+            click.echo(f"Miner {worker_id} stopped.")
+
     @app.cli.command("migrate-to-blockchain")
-    def migrate_to_blockchain_command():
+    @click.option("--bulk", is_flag=True, help="Pack records into large blocks with bulk inserts; resumable.")
+    @click.option("--chunk-size", default=1000, show_default=True, help="Source rows read per query in bulk mode.")
+    @click.option("--block-size", default=500, show_default=True, help="Transactions per block in bulk mode.")
+    def migrate_to_blockchain_command(bulk, chunk_size, block_size):
         """Migrate existing betting data to blockchain transactions."""
         with app.app_context():
             # Create genesis block if it doesn't exist
@@ -23,12 +164,27 @@ def register_cli_commands(app):
                 db.session.commit()
                 click.echo("Created genesis block.")
             
-            # Check if we already have transactions
-            existing_transactions = Transaction.query.count()
-            if existing_transactions > 0:
+            # Check if we already have transactions, unless a bulk run was interrupted
+            bulk_state = migration_state()
+            existing_transactions = Transaction.query.count() + PendingTransaction.query.count()
+            if bulk_state == 'done' or (existing_transactions > 0 and bulk_state != 'partial'):
                 click.echo(f"Found {existing_transactions} existing blockchain transactions.")
                 click.echo("Blockchain already migrated - skipping migration to avoid duplicates.")
                 return
+
+            if bulk or bulk_state == 'partial':
+                if bulk_state == 'partial':
+                    click.echo("Resuming interrupted bulk migration...")
+
+                def report(stage, records, elapsed):
+                    click.echo(f"  {stage}: {records} records migrated ({records / elapsed:.0f} records/s)")
+
+                records, blocks, elapsed = migrate_bulk(chunk_size=chunk_size, block_size=block_size, progress=report)
+                click.echo("\nMigration completed!")
+                click.echo(f"Created {records} blockchain transactions in {blocks} blocks "
+                           f"in {elapsed:.1f}s ({records / elapsed if elapsed else 0:.0f} records/s).")
+                click.echo(f"Chain is valid: {Blockchain.validate_chain()}")
+                return
             
             transactions_created = 0
             
@@ -104,7 +260,27 @@ def register_cli_commands(app):
                 Blockchain.add_transaction('bet_resolution', user_id=bet.creator_id, bet_id=bet.id, data=resolution_data)
                 transactions_created += 1
             
+            Blockchain.flush_mempool()
+
             click.echo("\nMigration completed!")
             click.echo(f"Created {transactions_created} blockchain transactions.")
             click.echo(f"Total blocks in chain: {Block.query.count()}")
-            click.echo(f"Chain is valid: {Blockchain.validate_chain()}")
\ No newline at end of file
+            click.echo(f"Chain is valid: {Blockchain.validate_chain()}")
+
+    @app.cli.command("upgrade")
+    def upgrade_command():
+        """Apply pending schema migrations and migrate legacy data to the ledger; run on every start."""
+        with app.app_context():
+            applied = migrations.upgrade(progress=lambda version, name: click.echo(f"Applied migration {version}: {name}"))
+            if not applied:
+                click.echo(f"Schema is up to date (version {migrations.HEAD}).")
+
+            # Only a database that has never had a ledger needs the historical records migrated
+            bulk_state = migration_state()
+            has_ledger = (db.session.query(Transaction.id).first() is not None
+                          or db.session.query(PendingTransaction.id).first() is not None)
+            if bulk_state == 'partial' or (bulk_state == 'fresh' and not has_ledger):
+                click.get_current_context().invoke(migrate_to_blockchain_command, bulk=True,
+                                                   chunk_size=1000, block_size=500)
+            else:
+                click.echo("Blockchain migration not needed.")
@@ -1,46 +1,40 @@
 #!/bin/sh
 
-# Define the path to the database file
-DB_FILE="/app/instance/bets.db"
+# Every process below writes its metrics here; /metrics adds them up
+export METRICS_DIR="${METRICS_DIR:-/tmp/metrics}"
+rm -rf "$METRICS_DIR"
 
-# Check if the database directory and file exist
-if [ ! -f "$DB_FILE" ]; then
-    echo "Database not found. Initializing database..."
-    flask init-db
-    echo "Running initial blockchain migration..."
-    flask migrate-to-blockchain
-else
-    echo "Database found. Ensuring database schema is up to date..."
-    echo "Running schema migrations..."
-    python migrate_add_block_balance.py
-    flask init-db
-    
-    # Check if blockchain migration is needed
-    echo "Checking blockchain migration status..."
-    python -c "
-from app import app
-from models import Block, Transaction
-import sqlalchemy
-with app.app_context():
-    try:
-        block_count = Block.query.count()
-        tx_count = Transaction.query.count()
-        print(f'Current blockchain has {block_count} blocks and {tx_count} transactions')
-        if block_count <= 1 and tx_count == 0:
-            print('No blockchain data found - migration needed')
-            exit(1)
-        else:
-            print('Blockchain already has data - skipping migration')
-            exit(0)
-    except sqlalchemy.exc.OperationalError as e:
-        print('Blockchain tables do not exist - migration needed')
-        exit(1)
-" && echo "Blockchain migration not needed." || {
-    echo "Running blockchain migration..."
-    flask migrate-to-blockchain
-}
-fi
+# Create or upgrade the schema, then migrate legacy data to the ledger if it
+# has never been migrated. On an up-to-date database this is a couple of
+# quick queries.
+echo "Upgrading database..."
+flask upgrade
 
-# Execute the main command (run the Flask app)
-echo "Starting Flask application..."
-exec flask run 
\ No newline at end of file
+# Mine sealed blocks in a separate process so requests never wait on proof-of-work,
+# and serve the app with gunicorn (see gunicorn.conf.py). This shell stays PID 1 and
+# passes the container's signals on: TERM and INT stop both processes gracefully, so
+# the miner finishes its current block, and HUP makes gunicorn replace its workers.
+# A miner killed mid-block anyway has its job requeued when the next miner starts.
+echo "Starting block miner..."
+flask run-miner &
+miner_pid=$!
+
+echo "Starting gunicorn..."
+gunicorn -c gunicorn.conf.py app:app &
+server_pid=$!
+
+trap 'kill -TERM "$server_pid" "$miner_pid" 2>/dev/null' TERM INT
+trap 'kill -HUP "$server_pid" 2>/dev/null' HUP
+
+# Poll rather than wait on one process, so that either one exiting stops the container;
+# a trapped signal interrupts the wait at once
+while kill -0 "$server_pid" 2>/dev/null && kill -0 "$miner_pid" 2>/dev/null; do
+    sleep 1 &
+    wait $!
+done
+
+kill -TERM "$server_pid" "$miner_pid" 2>/dev/null
+wait "$server_pid"
+status=$?
+wait "$miner_pid"
+exit $status
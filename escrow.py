@@ -0,0 +1,135 @@
+import datetime
+from models import db, User, Service, ServiceTransaction
+import ledger
+from identity import invalidate_users
+
+class EscrowError(Exception):
+    """A purchase, completion or cancellation that cannot go ahead; the message is shown to the user"""
+
+    def __init__(self, message, category='warning'):
+        super().__init__(message)
+        self.message = message
+        self.category = category
+
+def purchase_service(service_id, buyer_id):
+    """Move a service's cost from the buyer into escrow and reserve the service.
+
+    The service is claimed with a conditional UPDATE (status 'available' to
+    'pending') and the buyer is debited with another (only while the
+    balance covers the cost), so concurrent purchases of the same service or
+    by the same buyer cannot both succeed. Both updates, the
+    ServiceTransaction and the ledger entry commit together. Raises
+    EscrowError, with nothing written, when a condition fails.
+    """
+    service = db.session.get(Service, service_id)
+    if service is None:
+        raise EscrowError('This service does not exist.', 'danger')
+    if service.provider_id == buyer_id:
+        raise EscrowError('You cannot purchase your own service.')
+
+    with ledger.record() as entries:
+        claimed = (Service.query
+                   .filter_by(id=service_id, status='available')
+                   .update({'status': 'pending'}, synchronize_session=False))
+        if not claimed:
+            raise EscrowError('This service is no longer available.')
+
+        debited = (User.query
+                   .filter(User.id == buyer_id, User.block_balance >= service.block_cost)
+                   .update({'block_balance': User.block_balance - service.block_cost}, synchronize_session=False))
+        if not debited:
+            balance = db.session.query(User.block_balance).filter_by(id=buyer_id).scalar()
+            raise EscrowError(f'Insufficient blocks. You need {service.block_cost} blocks but only have {balance}.',
+                              'danger')
+
+        transaction = ServiceTransaction(
+            service_id=service_id,
+            buyer_id=buyer_id,
+            blocks_spent=service.block_cost
+        )
+        db.session.add(transaction)
+
+        purchase_data = {
+            'service_id': service_id,
+            'service_title': service.title,
+            'buyer_id': buyer_id,
+            'provider_id': service.provider_id,
+            'blocks_spent': service.block_cost,
+            'purchase_time': datetime.datetime.now().isoformat()
+        }
+        entries.add('service_purchase', user_id=buyer_id, data=purchase_data)
+
+    invalidate_users([buyer_id])
+    return transaction
+
+def _close_transaction(transaction_id, actor_id, new_status):
+    """Conditionally move a pending ServiceTransaction to new_status; call inside ledger.record()"""
+    transaction = db.session.get(ServiceTransaction, transaction_id)
+    if transaction is None:
+        raise EscrowError('This transaction does not exist.', 'danger')
+    if actor_id not in (transaction.buyer_id, transaction.service.provider_id):
+        raise EscrowError(f'You are not authorized to {"complete" if new_status == "completed" else "cancel"} '
+                          'this transaction.', 'danger')
+
+    values = {'status': new_status}
+    if new_status == 'completed':
+        values['completed_at'] = datetime.datetime.now()
+    closed = (ServiceTransaction.query
+              .filter_by(id=transaction_id, status='pending')
+              .update(values, synchronize_session=False))
+    if not closed:
+        raise EscrowError('This transaction is not in pending status.')
+    return transaction
+
+def complete_service(transaction_id, actor_id):
+    """Release a pending purchase's escrowed blocks to the provider.
+
+    Only the buyer or the provider may complete it, and only once: the
+    pending-to-completed transition is a conditional UPDATE. Raises
+    EscrowError otherwise.
+    """
+    with ledger.record() as entries:
+        transaction = _close_transaction(transaction_id, actor_id, 'completed')
+        provider_id = transaction.service.provider_id
+        User.query.filter_by(id=provider_id).update(
+            {'block_balance': User.block_balance + transaction.blocks_spent}, synchronize_session=False)
+        Service.query.filter_by(id=transaction.service_id).update({'status': 'completed'}, synchronize_session=False)
+
+        completion_data = {
+            'transaction_id': transaction_id,
+            'service_title': transaction.service.title,
+            'buyer_id': transaction.buyer_id,
+            'provider_id': provider_id,
+            'blocks_transferred': transaction.blocks_spent,
+            'completed_by': actor_id,
+            'completion_time': datetime.datetime.now().isoformat()
+        }
+        entries.add('service_completion', user_id=actor_id, data=completion_data)
+
+    invalidate_users([provider_id])
+
+def cancel_service(transaction_id, actor_id):
+    """Refund a pending purchase's escrowed blocks to the buyer and relist the service.
+
+    Same rules as complete_service: buyer or provider only, and a
+    conditional pending-to-cancelled transition. Raises EscrowError otherwise.
+    """
+    with ledger.record() as entries:
+        transaction = _close_transaction(transaction_id, actor_id, 'cancelled')
+        buyer_id = transaction.buyer_id
+        User.query.filter_by(id=buyer_id).update(
+            {'block_balance': User.block_balance + transaction.blocks_spent}, synchronize_session=False)
+        Service.query.filter_by(id=transaction.service_id).update({'status': 'available'}, synchronize_session=False)
+
+        cancellation_data = {
+            'transaction_id': transaction_id,
+            'service_title': transaction.service.title,
+            'buyer_id': buyer_id,
+            'provider_id': transaction.service.provider_id,
+            'blocks_refunded': transaction.blocks_spent,
+            'cancelled_by': actor_id,
+            'cancellation_time': datetime.datetime.now().isoformat()
+        }
+        entries.add('service_cancellation', user_id=actor_id, data=cancellation_data)
+
+    invalidate_users([buyer_id])
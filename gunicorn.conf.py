@@ -0,0 +1,70 @@
+"""
+Gunicorn settings for serving the app in production.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Every setting can be overridden through the GUNICORN_* environment variables
+below. Worker processes default to 2 x CPUs + 1, where CPUs is the
+container's cgroup CPU quota rather than the host's core count.
+"""
+import math
+import os
+
+def cpu_quota():
+    """CPUs this container may use: the cgroup quota if one is set, else the CPUs visible to it"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: a quota of -1 means unlimited
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# Threaded workers: requests mostly wait on SQLite and bcrypt, both of which release the GIL
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', cpu_quota() * 2 + 1))
+# Twice the default bcrypt slots (BCRYPT_WORKERS + BCRYPT_QUEUE_SIZE), so logins can hold
+# at most half of a worker's threads and page views keep the rest
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Import the app (and run create_app) once in the master; workers share the loaded code
+preload_app = True
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None  # Empty turns it off
+errorlog = '-'
+
+def on_starting(server):
+    from config import Config
+    slots = Config.BCRYPT_WORKERS + Config.BCRYPT_QUEUE_SIZE
+    if slots >= threads:
+        server.log.warning("BCRYPT_WORKERS + BCRYPT_QUEUE_SIZE (%d) is not below GUNICORN_THREADS (%d): "
+                           "logins can take every request thread and are never turned away with a 503",
+                           slots, threads)
+
+def post_fork(server, worker):
+    # The master may have opened database connections while loading the app;
+    # each worker must open its own instead of sharing those sockets and files
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
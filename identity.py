@@ -0,0 +1,46 @@
+from flask import current_app
+from flask_login import UserMixin
+from models import db, User
+from cache import MemoryCache
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of the User fields pages show, served to flask-login as current_user.
+
+    Anything that changes a user must update the User row itself, never a
+    snapshot.
+    """
+
+    def __init__(self, id, name, email, wins, losses, block_balance):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.wins = wins
+        self.losses = losses
+        self.block_balance = block_balance
+
+def init_user_cache(app):
+    app.extensions['user_cache'] = MemoryCache(max_entries=app.config['USER_CACHE_MAX_ENTRIES'],
+                                               ttl=app.config['USER_CACHE_TTL_SECONDS'])
+
+def load_user_snapshot(user_id):
+    """Return the cached snapshot of user_id, loading it on a miss; None if the user is gone.
+
+    The cache is per process, so a change made by another worker shows up
+    once the entry expires after USER_CACHE_TTL_SECONDS.
+    """
+    user_cache = current_app.extensions['user_cache']
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        row = (db.session.query(User.id, User.name, User.email, User.wins, User.losses, User.block_balance)
+               .filter(User.id == user_id).first())
+        if row is None:
+            return None
+        snapshot = UserSnapshot(*row)
+        user_cache.set(user_id, snapshot)
+    return snapshot
+
+def invalidate_users(user_ids):
+    """Forget the snapshots of user_ids after their rows change"""
+    user_cache = current_app.extensions['user_cache']
+    for user_id in user_ids:
+        user_cache.delete(user_id)
@@ -0,0 +1,97 @@
+import bisect
+import threading
+import time
+from flask import current_app
+from models import db, User
+from cache import namespace_versions
+
+class LeaderboardCache:
+    """Users ranked by most wins, then fewest losses, kept sorted in memory.
+
+    Ranks are held as a sorted list of (-wins, losses, user_id) keys, so a
+    page is a slice and a user's rank is one bisect. Settlement updates the
+    users it touched in place. The whole board is reloaded from the database
+    when the shared 'leaderboard' cache namespace changes, which settlement
+    in any process causes, and every LEADERBOARD_REFRESH_SECONDS to pick up
+    other changes, such as new users.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._users = {}  # user id -> (key, name)
+        self._loaded_at = None
+        self._version = None
+
+    @staticmethod
+    def _key(user_id, wins, losses):
+        return (-wins, losses, user_id)
+
+    def _ensure_fresh(self):
+        refresh_seconds = current_app.config['LEADERBOARD_REFRESH_SECONDS']
+        version, = namespace_versions(['leaderboard'])
+        if (self._loaded_at is not None and version == self._version
+                and time.monotonic() - self._loaded_at < refresh_seconds):
+            return
+        rows = db.session.query(User.id, User.name, User.wins, User.losses).all()
+        users = {user_id: (self._key(user_id, wins, losses), name) for user_id, name, wins, losses in rows}
+        with self._lock:
+            self._users = users
+            self._keys = sorted(key for key, _ in users.values())
+            self._loaded_at = time.monotonic()
+            self._version = version
+
+    def _place(self, user_id, name, wins, losses):
+        """Move one user to the position for their record; call with the lock held"""
+        old = self._users.get(user_id)
+        if old:
+            del self._keys[bisect.bisect_left(self._keys, old[0])]
+        key = self._key(user_id, wins, losses)
+        bisect.insort(self._keys, key)
+        self._users[user_id] = (key, name)
+
+    def refresh_users(self, user_ids):
+        """Re-rank user_ids from their committed records"""
+        if self._loaded_at is None or not user_ids:
+            return
+        rows = (db.session.query(User.id, User.name, User.wins, User.losses)
+                .filter(User.id.in_(user_ids)).all())
+        with self._lock:
+            for user_id, name, wins, losses in rows:
+                self._place(user_id, name, wins, losses)
+
+    def page(self, offset, limit):
+        """Return (entries, total) for one page; entries are dicts with rank, user_id, name, wins and losses"""
+        self._ensure_fresh()
+        with self._lock:
+            keys = self._keys[offset:offset + limit]
+            entries = [{
+                'rank': offset + position + 1,
+                'user_id': user_id,
+                'name': self._users[user_id][1],
+                'wins': -negative_wins,
+                'losses': losses
+            } for position, (negative_wins, losses, user_id) in enumerate(keys)]
+            return entries, len(self._keys)
+
+    def rank(self, user):
+        """1-based rank of user.
+
+        A user the board has not loaded yet, such as one who signed up since the
+        last reload, is added at the place their own wins and losses give them,
+        with ties broken by user id as in a full reload.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            if user.id not in self._users:
+                self._place(user.id, user.name, user.wins, user.losses)
+            return bisect.bisect_left(self._keys, self._users[user.id][0]) + 1
+
+    def clear(self):
+        with self._lock:
+            self._keys = []
+            self._users = {}
+            self._loaded_at = None
+            self._version = None
+
+leaderboard_cache = LeaderboardCache()
@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+from models import db
+from blockchain import Blockchain
+
+class LedgerBatch:
+    """Ledger transactions staged alongside the domain rows of one unit of work"""
+
+    def __init__(self):
+        self.transactions = []
+
+    def add(self, transaction_type, user_id=None, bet_id=None, data=None):
+        transaction = Blockchain.add_transaction(transaction_type, user_id=user_id, bet_id=bet_id,
+                                                 data=data, commit=False)
+        self.transactions.append(transaction)
+        return transaction
+
+@contextmanager
+def record():
+    """Commit domain changes and their ledger transactions together.
+
+        with ledger.record() as entries:
+            db.session.add(new_bet)
+            db.session.flush()  # when the ledger entry needs the new row's id
+            entries.add('bet_creation', user_id=..., bet_id=new_bet.id, data=...)
+
+    Everything staged inside the block is written in a single commit, or
+    rolled back if the block raises. Block sealing runs after the commit.
+    """
+    batch = LedgerBatch()
+    try:
+        yield batch
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    Blockchain.build_blocks()
@@ -0,0 +1,142 @@
+import re
+from flask import current_app
+from sqlalchemy import and_, or_, table, column, text
+from sqlalchemy.orm import joinedload
+from models import db, Service
+
+# Sort name -> (column, descending); every sort breaks ties on Service.id in the same direction
+SORTS = {
+    'newest': (None, True),
+    'oldest': (None, False),
+    'cost_low': (Service.block_cost, False),
+    'cost_high': (Service.block_cost, True),
+}
+
+# Lightweight handle on the FTS5 table; it is not part of the model metadata, so create_all skips it
+service_fts = table('service_fts', column('rowid'))
+
+FTS_STATEMENTS = [
+    "CREATE VIRTUAL TABLE service_fts USING fts5(title, description, content='service', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS service_fts_insert AFTER INSERT ON service BEGIN
+           INSERT INTO service_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS service_fts_delete AFTER DELETE ON service BEGIN
+           INSERT INTO service_fts(service_fts, rowid, title, description)
+           VALUES ('delete', old.id, old.title, old.description);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS service_fts_update AFTER UPDATE OF title, description ON service BEGIN
+           INSERT INTO service_fts(service_fts, rowid, title, description)
+           VALUES ('delete', old.id, old.title, old.description);
+           INSERT INTO service_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+       END""",
+    "INSERT INTO service_fts(service_fts) VALUES ('rebuild')",
+]
+
+def create_service_search(connection):
+    """Create the SQLite FTS5 index over service titles and descriptions, if this build has FTS5.
+
+    Used by the schema migrations; returns whether the index exists afterwards.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'service_fts'")).scalar()
+    if exists:
+        return True
+    if not connection.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+        return False
+    for statement in FTS_STATEMENTS:
+        connection.execute(text(statement))
+    return True
+
+def search_mode():
+    """'fts5' when the service_fts index exists, otherwise 'like'; looked up once per process"""
+    mode = current_app.extensions.get('service_search')
+    if mode is None:
+        mode = 'like'
+        if db.engine.dialect.name == 'sqlite':
+            exists = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'service_fts'")).scalar()
+            if exists:
+                mode = 'fts5'
+        current_app.extensions['service_search'] = mode
+    return mode
+
+def _search_terms(query):
+    return re.findall(r'\w+', query)[:10]
+
+def _apply_text_search(services_query, query, search_mode):
+    """Restrict services_query to services matching every word of query.
+
+    Returns the query and the column to order ids by: with FTS5 that is the
+    index's rowid, so newest/oldest pages stream straight out of the index
+    instead of collecting every match first.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return services_query, Service.id
+    if search_mode == 'fts5':
+        # Quoted prefix terms, all required, so user input is never parsed as FTS syntax
+        match = ' '.join(f'"{term}"*' for term in terms)
+        services_query = (services_query
+                          .join(service_fts, service_fts.c.rowid == Service.id)
+                          .filter(text('service_fts MATCH :match').bindparams(match=match)))
+        return services_query, service_fts.c.rowid
+    return services_query.filter(and_(*[
+        or_(Service.title.ilike(f'%{term}%'), Service.description.ilike(f'%{term}%')) for term in terms
+    ])), Service.id
+
+def parse_cursor(cursor, sort):
+    """Turn an ?after= value back into (sort value, id), or None if it does not parse"""
+    try:
+        if SORTS[sort][0] is None:
+            return None, int(cursor)
+        value, service_id = cursor.split(':')
+        return int(value), int(service_id)
+    except (AttributeError, KeyError, ValueError):
+        return None
+
+def _cursor_for(service, sort):
+    if SORTS[sort][0] is None:
+        return str(service.id)
+    return f'{service.block_cost}:{service.id}'
+
+def search_services(search_mode, query=None, min_cost=None, max_cost=None, provider_id=None,
+                    sort='newest', after=None, limit=24):
+    """Return one page of available services and the ?after= cursor for the next page.
+
+    Results are read with keyset pagination on (sort column, id), so later
+    pages cost the same as the first. The cursor is None on the last page.
+    """
+    if sort not in SORTS:
+        sort = 'newest'
+    column, descending = SORTS[sort]
+
+    services_query = Service.query.options(joinedload(Service.provider)).filter(Service.status == 'available')
+    if min_cost is not None:
+        services_query = services_query.filter(Service.block_cost >= min_cost)
+    if max_cost is not None:
+        services_query = services_query.filter(Service.block_cost <= max_cost)
+    if provider_id is not None:
+        services_query = services_query.filter(Service.provider_id == provider_id)
+    id_column = Service.id
+    if query:
+        services_query, id_column = _apply_text_search(services_query, query, search_mode)
+
+    position = parse_cursor(after, sort) if after else None
+    if position:
+        value, service_id = position
+        id_past = id_column < service_id if descending else id_column > service_id
+        if column is None:
+            services_query = services_query.filter(id_past)
+        else:
+            value_past = column < value if descending else column > value
+            services_query = services_query.filter(or_(value_past, and_(column == value, id_past)))
+
+    ordering = [id_column.desc() if descending else id_column.asc()]
+    if column is not None:
+        ordering.insert(0, column.desc() if descending else column.asc())
+
+    services = services_query.order_by(*ordering).limit(limit + 1).all()
+    next_cursor = _cursor_for(services[limit - 1], sort) if len(services) > limit else None
+    return services[:limit], next_cursor
@@ -0,0 +1,57 @@
+"""
+Merkle tree helpers shared by the chain and by anyone auditing it.
+
+Only hashlib is needed, so verify_proof can be copied into a client to check
+a proof from /api/tx/<hash>/proof against a block's merkle root without
+trusting the server or downloading the chain.
+"""
+import hashlib
+
+def build_levels(leaf_hashes):
+    """Return every level of the tree, leaves first and the root last.
+
+    An odd node at the end of a level is paired with itself.
+    """
+    if not leaf_hashes:
+        return []
+
+    levels = [list(leaf_hashes)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        next_level = []
+        for i in range(0, len(level), 2):
+            right = level[i + 1] if i + 1 < len(level) else level[i]
+            next_level.append(hashlib.sha256((level[i] + right).encode()).hexdigest())
+        levels.append(next_level)
+    return levels
+
+def root_of(levels):
+    return levels[-1][0] if levels else "0"
+
+def proof_path(levels, leaf_index):
+    """List the sibling hashes from leaf_index up to the root.
+
+    Each step is {'hash': sibling, 'position': 'left' or 'right'}, the side
+    the sibling sits on when the two are combined.
+    """
+    path = []
+    index = leaf_index
+    for level in levels[:-1]:
+        if index % 2 == 0:
+            sibling = level[index + 1] if index + 1 < len(level) else level[index]
+            path.append({'hash': sibling, 'position': 'right'})
+        else:
+            path.append({'hash': level[index - 1], 'position': 'left'})
+        index //= 2
+    return path
+
+def verify_proof(tx_hash, path, merkle_root):
+    """Check that tx_hash is committed to by merkle_root via path"""
+    current = tx_hash
+    for step in path:
+        if step['position'] == 'left':
+            combined = step['hash'] + current
+        else:
+            combined = current + step['hash']
+        current = hashlib.sha256(combined.encode()).hexdigest()
+    return current == merkle_root
@@ -0,0 +1,312 @@
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from collections import Counter as Tally
+from functools import wraps
+from flask import Blueprint, Response, abort, current_app, g, has_request_context, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+
+# Upper bounds in seconds, as in the Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+MINING_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Registry:
+    """Every metric in this process, and the file its values are shared through.
+
+    With METRICS_DIR set, each process (web workers and `flask run-miner`)
+    writes its values to <METRICS_DIR>/<pid>.json at most every
+    METRICS_FLUSH_SECONDS, and /metrics adds up all the files. Without it,
+    /metrics reports only the process that served the scrape.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.directory = None
+        self.flush_seconds = 5
+        self._dirty = False
+        self._flushed_at = 0
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def configure(self, directory, flush_seconds):
+        self.directory = directory or None
+        self.flush_seconds = flush_seconds
+
+    def changed(self):
+        self._dirty = True
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush()
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def flush(self):
+        """Write this process's values to METRICS_DIR if anything changed since the last write"""
+        if not self.directory:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._flushed_at = time.monotonic()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+
+    def collect(self):
+        """Values of every metric, summed over all processes sharing METRICS_DIR"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        combined = {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue  # Removed or replaced while we listed the directory
+            for name, series in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is not None:
+                    metric.merge(combined.setdefault(name, {}), series)
+        return combined
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        values = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels_key, value in sorted(values.get(name, {}).items()):
+                lines.extend(metric.exposition(json.loads(labels_key), value))
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+def _series_key(labels, label_values):
+    # JSON, so that snapshots from every process can be written to and merged from files
+    return json.dumps(list(zip(labels, label_values)))
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic count, optionally split by label values"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+        registry.changed()
+
+    def snapshot(self):
+        with self._lock:
+            return {_series_key(self.labels, key): value for key, value in self._values.items()}
+
+    def merge(self, combined, series):
+        for key, value in series.items():
+            combined[key] = combined.get(key, 0) + value
+
+    def exposition(self, pairs, value):
+        return [f'{self.name}{_format_labels(pairs)} {_format_number(value)}']
+
+class Histogram:
+    """Distribution of observed values over fixed buckets, optionally split by label values"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                # Per-bucket (not cumulative) counts with an overflow slot, then sum and count
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+        registry.changed()
+
+    def time(self, *label_values):
+        """Context manager and decorator that observes the seconds spent inside it"""
+        return _Timer(self, label_values)
+
+    def snapshot(self):
+        with self._lock:
+            return {_series_key(self.labels, key): [list(counts), total, count]
+                    for key, (counts, total, count) in self._values.items()}
+
+    def merge(self, combined, series):
+        for key, (counts, total, count) in series.items():
+            if key not in combined:
+                combined[key] = [list(counts), total, count]
+                continue
+            merged = combined[key]
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+
+    def exposition(self, pairs, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            le = bound if bound == '+Inf' else _format_number(float(bound))
+            lines.append(f'{self.name}_bucket{_format_labels(pairs + [["le", le]])} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(pairs)} {_format_number(float(total))}')
+        lines.append(f'{self.name}_count{_format_labels(pairs)} {count}')
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.label_values):
+                return function(*args, **kwargs)
+        return wrapper
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time to handle a request',
+                            ['endpoint', 'method'])
+REQUESTS = Counter('http_requests_total', 'Requests handled, by response status', ['endpoint', 'method', 'status'])
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'SQL statements executed while handling a request',
+                            ['endpoint'], buckets=QUERY_COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram('http_request_db_seconds', 'Time spent in SQL statements while handling a request',
+                               ['endpoint'])
+REPEATED_QUERY_REQUESTS = Counter('http_request_repeated_query_total',
+                                  'Requests that ran one SQL statement at least QUERY_REPEAT_WARNING times',
+                                  ['endpoint'])
+QUERY_SECONDS = Histogram('db_query_duration_seconds', 'Time per SQL statement, in and outside requests')
+TEMPLATE_SECONDS = Histogram('template_render_seconds', 'Time to render a template', ['template'])
+MINING_SECONDS = Histogram('block_mining_seconds', 'Proof-of-work time per block', buckets=MINING_BUCKETS)
+CHAIN_VALIDATION_SECONDS = Histogram('chain_validation_seconds', 'Time per Blockchain.validate_chain call')
+MERKLE_BUILD_SECONDS = Histogram('merkle_build_seconds', 'Time to build the Merkle tree of one block')
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    QUERY_SECONDS.observe(elapsed)
+    if has_request_context() and 'query_statements' in g:
+        g.query_seconds += elapsed
+        g.query_statements[statement] += 1
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('render_started', []).append(time.perf_counter())
+
+def _after_render(sender, template, context, **extra):
+    if has_request_context() and g.get('render_started'):
+        TEMPLATE_SECONDS.observe(time.perf_counter() - g.render_started.pop(), template.name or 'string')
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.query_seconds = 0.0
+    g.query_statements = Tally()
+
+def _record_request(status):
+    if g.get('request_recorded') or 'request_started' not in g:
+        return
+    g.request_recorded = True
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, endpoint, request.method)
+    REQUESTS.inc(endpoint, request.method, str(status))
+    REQUEST_QUERIES.observe(sum(g.query_statements.values()), endpoint)
+    REQUEST_DB_SECONDS.observe(g.query_seconds, endpoint)
+
+    threshold = current_app.config['QUERY_REPEAT_WARNING']
+    if threshold and g.query_statements:
+        statement, times = g.query_statements.most_common(1)[0]
+        if times >= threshold:
+            REPEATED_QUERY_REQUESTS.inc(endpoint)
+            current_app.logger.warning('Possible N+1 in %s %s: one statement ran %d times: %s',
+                                       request.method, request.path, times, ' '.join(statement.split()))
+    return elapsed
+
+def _finish_request(response):
+    elapsed = _record_request(response.status_code)
+    if elapsed is not None:
+        queries = sum(g.query_statements.values())
+        response.headers['Server-Timing'] = (f'db;dur={g.query_seconds * 1000:.1f};desc="{queries} queries", '
+                                             f'app;dur={elapsed * 1000:.1f}')
+    return response
+
+def _teardown_request(error):
+    # after_request does not run when the view raised, so record those here
+    if error is not None:
+        _record_request(500)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def metrics_endpoint():
+    """Every metric in the Prometheus text format, for scrapers"""
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def init_metrics(app, db):
+    """Time requests, SQL statements and template rendering, and serve /metrics"""
+    registry.configure(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_SECONDS'])
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(db.engine, 'handle_error', _handle_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    app.register_blueprint(metrics_bp)
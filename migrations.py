@@ -0,0 +1,101 @@
+import time
+from flask import current_app
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from models import db, SchemaVersion, Transaction, Service, ServiceTransaction, CacheNamespace
+from bet_stats import rebuild_tallies
+from marketplace import create_service_search
+
+# Each step runs once, in order, in the same commit as its SchemaVersion row.
+# Steps must be idempotent: databases that predate this table replay them all.
+# Append new steps at the end and never change one that has shipped.
+
+def _add_user_block_balance():
+    inspector = inspect(db.session.connection())
+    if not inspector.has_table('user'):
+        return  # Fresh database; the next step creates the table with the column
+    if 'block_balance' not in [column['name'] for column in inspector.get_columns('user')]:
+        db.session.execute(text('ALTER TABLE "user" ADD COLUMN block_balance INTEGER DEFAULT 0 NOT NULL'))
+
+def _create_missing_tables():
+    db.metadata.create_all(bind=db.session.connection())
+
+def _create_lookup_indexes():
+    # create_all only indexes the tables it creates, so add these to older tables too
+    connection = db.session.connection()
+    for table in (Transaction.__table__, Service.__table__, ServiceTransaction.__table__):
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+def _create_service_search():
+    create_service_search(db.session.connection())
+
+def _backfill_bet_outcome_tallies():
+    rebuild_tallies(commit=False)
+
+def _create_cache_namespaces():
+    CacheNamespace.__table__.create(bind=db.session.connection(), checkfirst=True)
+
+MIGRATIONS = [
+    (1, 'add_user_block_balance', _add_user_block_balance),
+    (2, 'create_missing_tables', _create_missing_tables),
+    (3, 'create_lookup_indexes', _create_lookup_indexes),
+    (4, 'create_service_search', _create_service_search),
+    (5, 'backfill_bet_outcome_tallies', _backfill_bet_outcome_tallies),
+    (6, 'create_cache_namespaces', _create_cache_namespaces),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+def current_version():
+    """Highest applied migration, 0 for none, or None if the version table does not exist yet"""
+    try:
+        return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return None
+
+def upgrade(progress=None):
+    """Apply every pending migration step and return the (version, name) pairs applied.
+
+    An up-to-date database costs a single query. progress, if given, is
+    called with (version, name) after each step commits.
+    """
+    version = current_version()
+    if version is None:
+        SchemaVersion.__table__.create(bind=db.engine, checkfirst=True)
+        version = 0
+
+    applied = []
+    for step_version, name, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        try:
+            step()
+            db.session.add(SchemaVersion(version=step_version, name=name, applied_at=time.time()))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append((step_version, name))
+        if progress:
+            progress(step_version, name)
+    return applied
+
+def require_current_schema():
+    """before_request hook that answers 503 until `flask upgrade` has brought the schema to HEAD.
+
+    Checked until it first passes, then once per process, so a fresh checkout
+    started with `flask run` says what is missing instead of failing every
+    page with "no such table".
+    """
+    if current_app.extensions.get('schema_current'):
+        return None
+    version = current_version()
+    if version is not None and version >= HEAD:
+        current_app.extensions['schema_current'] = True
+        return None
+    message = (f"The database schema is at version {version or 0} of {HEAD}. "
+               "Run `flask upgrade` to create or upgrade it, then reload this page.")
+    current_app.logger.error(message)
+    return current_app.response_class(message, status=503, mimetype='text/plain')
@@ -0,0 +1,74 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+_executor = None
+_executor_workers = 0
+
+def header_prefix(index, timestamp, previous_hash, merkle_root):
+    """The part of Block.calculate_hash's input that does not depend on the nonce"""
+    return f"{index}{timestamp}{previous_hash}{merkle_root}"
+
+def search_range(prefix, start, stop, difficulty):
+    """Scan nonces in [start, stop) and return the first (nonce, hash) that meets the target"""
+    target = "0" * difficulty
+    base = hashlib.sha256(prefix.encode())
+    for nonce in range(start, stop):
+        candidate = base.copy()
+        candidate.update(str(nonce).encode())
+        block_hash = candidate.hexdigest()
+        if block_hash.startswith(target):
+            return nonce, block_hash
+    return None
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _executor_workers = workers
+    return _executor
+
+def find_nonce(prefix, difficulty, start=0, workers=1, chunk_size=50000):
+    """Find the lowest nonce >= start whose hash meets the difficulty target.
+
+    With more than one worker the nonce space is cut into chunks that are
+    handed to a process pool a few at a time. Once a chunk reports a hit no
+    further chunks are started and queued ones are cancelled; chunks below the
+    hit are still awaited so the result is the same nonce a single-core
+    search would find.
+    """
+    if workers <= 1:
+        nonce = start
+        while True:
+            found = search_range(prefix, nonce, nonce + chunk_size, difficulty)
+            if found:
+                return found
+            nonce += chunk_size
+
+    executor = _get_executor(workers)
+    in_flight = {}
+    next_start = start
+    best = None
+
+    while True:
+        while best is None and len(in_flight) < workers * 2:
+            future = executor.submit(search_range, prefix, next_start, next_start + chunk_size, difficulty)
+            in_flight[future] = next_start
+            next_start += chunk_size
+
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            del in_flight[future]
+            found = future.result()
+            if found and (best is None or found[0] < best[0]):
+                best = found
+
+        if best is not None:
+            for future, chunk_start in list(in_flight.items()):
+                if chunk_start > best[0] and future.cancel():
+                    del in_flight[future]
+            if not any(chunk_start < best[0] for chunk_start in in_flight.values()):
+                for future in in_flight:
+                    future.cancel()
+                return best
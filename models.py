@@ -1,6 +1,6 @@
-import bcrypt
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from metrics import MINING_SECONDS
 
 db = SQLAlchemy()
 
@@ -8,19 +8,13 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
-    password_hash = db.Column(db.String(200), nullable=False)
+    password_hash = db.Column(db.String(200), nullable=False)  # Hash and check with passwords.py
     bets_placed = db.relationship('UserBet', backref='user', lazy='dynamic')
     created_bets = db.relationship('Bet', backref='creator', lazy='dynamic')
     wins = db.Column(db.Integer, default=0, nullable=False)
     losses = db.Column(db.Integer, default=0, nullable=False)
     block_balance = db.Column(db.Integer, default=0, nullable=False)
 
-    def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-    def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
-
 class Bet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -43,6 +37,12 @@ class UserBet(db.Model):
 
     __table_args__ = (db.UniqueConstraint('user_id', 'bet_id', name='_user_bet_uc'),)
 
+class BetOutcomeTally(db.Model):
+    """Number of wagers on each outcome of a bet, kept in step with UserBet"""
+    bet_id = db.Column(db.Integer, db.ForeignKey('bet.id'), primary_key=True)
+    outcome = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
 class Block(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     index = db.Column(db.Integer, nullable=False, unique=True)
@@ -58,16 +58,15 @@ class Block(db.Model):
         block_string = f"{self.index}{self.timestamp}{self.previous_hash}{self.merkle_root}{self.nonce}"
         return hashlib.sha256(block_string.encode()).hexdigest()
 
-    def mine_block(self, difficulty=4):
-        target = "0" * difficulty
-        self.hash = self.calculate_hash()
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self.calculate_hash()
+    def mine_block(self, difficulty=4, workers=1):
+        from mining import header_prefix, find_nonce
+        prefix = header_prefix(self.index, self.timestamp, self.previous_hash, self.merkle_root)
+        with MINING_SECONDS.time():
+            self.nonce, self.hash = find_nonce(prefix, difficulty, start=self.nonce or 0, workers=workers)
 
-class Transaction(db.Model):
+class LedgerEntryMixin:
+    """Columns and hashing shared by mined transactions and the mempool"""
     id = db.Column(db.Integer, primary_key=True)
-    block_id = db.Column(db.Integer, db.ForeignKey('block.id'), nullable=False)
     transaction_type = db.Column(db.String(50), nullable=False)  # 'user_registration', 'bet_creation', 'bet_placement', 'bet_resolution'
     user_id = db.Column(db.Integer, nullable=True)
     bet_id = db.Column(db.Integer, nullable=True)
@@ -75,11 +74,15 @@ class Transaction(db.Model):
     hash = db.Column(db.String(64), nullable=False, unique=True)
     timestamp = db.Column(db.Float, nullable=False)
 
-    def calculate_hash(self):
+    @staticmethod
+    def hash_fields(transaction_type, user_id, bet_id, data, timestamp):
         import hashlib
-        transaction_string = f"{self.transaction_type}{self.user_id}{self.bet_id}{self.data}{self.timestamp}"
+        transaction_string = f"{transaction_type}{user_id}{bet_id}{data}{timestamp}"
         return hashlib.sha256(transaction_string.encode()).hexdigest()
 
+    def calculate_hash(self):
+        return self.hash_fields(self.transaction_type, self.user_id, self.bet_id, self.data, self.timestamp)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if not self.timestamp:
@@ -88,6 +91,81 @@ class Transaction(db.Model):
         if not self.hash:
             self.hash = self.calculate_hash()
 
+class Transaction(LedgerEntryMixin, db.Model):
+    block_id = db.Column(db.Integer, db.ForeignKey('block.id'), nullable=False)
+
+    # Keyset lookups: one entity's history in id order is a single index range scan
+    __table_args__ = (
+        db.Index('ix_transaction_user_id_id', 'user_id', 'id'),
+        db.Index('ix_transaction_bet_id_id', 'bet_id', 'id'),
+        db.Index('ix_transaction_type_id', 'transaction_type', 'id'),
+        db.Index('ix_transaction_block_id_id', 'block_id', 'id'),
+    )
+
+class PendingTransaction(LedgerEntryMixin, db.Model):
+    """A transaction waiting in the mempool to be sealed into a block"""
+    job_id = db.Column(db.Integer, db.ForeignKey('mining_job.id'), nullable=True)  # Set once sealed
+
+    def to_transaction(self):
+        return Transaction(
+            transaction_type=self.transaction_type,
+            user_id=self.user_id,
+            bet_id=self.bet_id,
+            data=self.data,
+            hash=self.hash,
+            timestamp=self.timestamp
+        )
+
+class MiningJob(db.Model):
+    """A sealed batch of mempool transactions waiting for the miner"""
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # 'queued', 'mining'
+    created_at = db.Column(db.Float, nullable=False)
+    claimed_at = db.Column(db.Float, nullable=True)
+    worker_id = db.Column(db.String(100), nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    transactions = db.relationship('PendingTransaction', backref='job', lazy='dynamic')
+
+    # Never reuse a finished job's id, or a miner whose lease expired could pick up someone else's job
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class SchemaVersion(db.Model):
+    """A schema migration step that has been applied to this database"""
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.Float, nullable=False)
+
+class MigrationCursor(db.Model):
+    """How far the bulk blockchain migration has got through one source table"""
+    stage = db.Column(db.String(50), primary_key=True)
+    last_source_id = db.Column(db.Integer, default=0, nullable=False)
+    completed = db.Column(db.Boolean, default=False, nullable=False)
+
+class CacheNamespace(db.Model):
+    """Current version of one response cache namespace, shared by every worker process"""
+    name = db.Column(db.String(200), primary_key=True)
+    version = db.Column(db.String(32), nullable=False)
+
+class ChainCheckpoint(db.Model):
+    """The highest block known to link back to genesis through valid blocks"""
+    id = db.Column(db.Integer, primary_key=True)
+    block_index = db.Column(db.Integer, nullable=False)
+    block_hash = db.Column(db.String(64), nullable=False)
+    validated_at = db.Column(db.Float, nullable=False)
+
+class ProjectionSnapshot(db.Model):
+    """Balances and bet records replayed from the ledger up to one block"""
+    id = db.Column(db.Integer, primary_key=True)
+    block_index = db.Column(db.Integer, nullable=False, index=True)
+    block_hash = db.Column(db.String(64), nullable=False)
+    users = db.Column(db.Text, nullable=False)  # JSON: {user_id: [block_balance, wins, losses]}
+    created_at = db.Column(db.Float, nullable=False)
+
+class MerkleTree(db.Model):
+    """Every level of a block's merkle tree as JSON, leaves first, so proofs need no rehashing"""
+    block_id = db.Column(db.Integer, db.ForeignKey('block.id'), primary_key=True)
+    levels = db.Column(db.Text, nullable=False)
+
 class Service(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -98,6 +176,13 @@ class Service(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     provider = db.relationship('User', backref='services_offered', lazy=True)
 
+    # Marketplace listings by status in id order, by cost, and per provider
+    __table_args__ = (
+        db.Index('ix_service_status_id', 'status', 'id'),
+        db.Index('ix_service_status_block_cost_id', 'status', 'block_cost', 'id'),
+        db.Index('ix_service_provider_id_status', 'provider_id', 'status', 'id'),
+    )
+
 class ServiceTransaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     service_id = db.Column(db.Integer, db.ForeignKey('service.id'), nullable=False)
@@ -107,4 +192,10 @@ class ServiceTransaction(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     completed_at = db.Column(db.DateTime, nullable=True)
     service = db.relationship('Service', backref='transactions', lazy=True)
-    buyer = db.relationship('User', backref='service_purchases', lazy=True)
\ No newline at end of file
+    buyer = db.relationship('User', backref='service_purchases', lazy=True)
+
+    # A buyer's purchases and the sales of a provider's services
+    __table_args__ = (
+        db.Index('ix_service_transaction_buyer_id_created_at', 'buyer_id', 'created_at'),
+        db.Index('ix_service_transaction_service_id', 'service_id'),
+    )
\ No newline at end of file
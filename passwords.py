@@ -0,0 +1,61 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from flask import current_app
+
+_executor = None
+_executor_pid = None
+_slots = None
+_lock = threading.Lock()
+
+class HashingBusy(Exception):
+    """Every bcrypt worker is busy and the queue is full; the request should be retried later"""
+
+def _get_executor():
+    # Threads do not survive a fork, so each worker process builds its own pool
+    global _executor, _executor_pid, _slots
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            config = current_app.config
+            _executor = ThreadPoolExecutor(max_workers=config['BCRYPT_WORKERS'], thread_name_prefix='bcrypt')
+            _slots = threading.BoundedSemaphore(config['BCRYPT_WORKERS'] + config['BCRYPT_QUEUE_SIZE'])
+            _executor_pid = os.getpid()
+        return _executor, _slots
+
+def _run(function, *args):
+    """Run function on the bcrypt pool and wait for it, or raise HashingBusy if the pool is saturated.
+
+    bcrypt releases the GIL, so while a request thread waits here the rest of
+    the process keeps serving pages. At most BCRYPT_WORKERS hashes run at
+    once and BCRYPT_QUEUE_SIZE more may wait; beyond that callers are turned
+    away at once instead of piling up.
+    """
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        return executor.submit(function, *args).result()
+    finally:
+        slots.release()
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def _check(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def hash_password(password):
+    """Hash password at the configured BCRYPT_ROUNDS; may raise HashingBusy"""
+    return _run(_hash, password, current_app.config['BCRYPT_ROUNDS'])
+
+def verify_password(password, password_hash):
+    """Check password against a stored bcrypt hash; may raise HashingBusy"""
+    return _run(_check, password, password_hash)
+
+def needs_rehash(password_hash):
+    """Whether password_hash was made with a cost other than BCRYPT_ROUNDS"""
+    try:
+        return int(password_hash.split('$')[2]) != current_app.config['BCRYPT_ROUNDS']
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,132 @@
+import json
+import time
+from flask import current_app
+from models import db, User, Block, Transaction, PendingTransaction, ProjectionSnapshot
+from blockchain import Blockchain
+
+PROJECTED_TYPES = ('block_reward', 'service_purchase', 'service_completion',
+                   'service_cancellation', 'bet_resolution')
+
+# Older snapshots are pruned; a few are kept in case the newest no longer matches the chain
+SNAPSHOTS_KEPT = 3
+
+def apply_transaction(users, transaction_type, data):
+    """Fold one ledger transaction into users, a dict of user id to [block_balance, wins, losses]"""
+    def account(user_id):
+        return users.setdefault(user_id, [0, 0, 0])
+
+    if transaction_type == 'block_reward':
+        if 'payouts' in data:
+            for payout in data['payouts']:
+                account(payout['user_id'])[0] += payout['blocks']
+        else:
+            # One transaction per winner, as written before rewards were batched
+            account(data['winner_id'])[0] += data['blocks_awarded']
+    elif transaction_type == 'service_purchase':
+        account(data['buyer_id'])[0] -= data['blocks_spent']
+    elif transaction_type == 'service_completion':
+        account(data['provider_id'])[0] += data['blocks_transferred']
+    elif transaction_type == 'service_cancellation':
+        account(data['buyer_id'])[0] += data['blocks_refunded']
+    elif transaction_type == 'bet_resolution':
+        for winner in data['winners']:
+            account(winner['user_id'])[1] += 1
+        for loser in data['losers']:
+            account(loser['user_id'])[2] += 1
+
+def latest_snapshot():
+    """Return the newest snapshot whose block is still on the chain, or None"""
+    snapshots = (ProjectionSnapshot.query
+                 .order_by(ProjectionSnapshot.block_index.desc())
+                 .limit(SNAPSHOTS_KEPT)
+                 .all())
+    for snapshot in snapshots:
+        block = Block.query.filter_by(index=snapshot.block_index).first()
+        if block and block.hash == snapshot.block_hash:
+            return snapshot
+    return None
+
+def _replay(query, users, batch_size):
+    for transaction_type, data in query.yield_per(batch_size):
+        apply_transaction(users, transaction_type, json.loads(data))
+
+def project(full=False, include_pending=False, batch_size=1000):
+    """Replay the ledger into balances and bet records.
+
+    Starts from the latest snapshot unless full is set, then replays the
+    transactions of every later block. include_pending also folds in the
+    mempool, which the User counters already reflect. Returns
+    (users, start_index, tip_index), where users maps user id to
+    [block_balance, wins, losses] and start_index is -1 for a full replay.
+    """
+    snapshot = None if full else latest_snapshot()
+    users = {int(user_id): values for user_id, values in json.loads(snapshot.users).items()} if snapshot else {}
+    start_index = snapshot.block_index if snapshot else -1
+    tip = Blockchain.get_latest_block()
+    tip_index = tip.index if tip else -1
+
+    mined = (db.session.query(Transaction.transaction_type, Transaction.data)
+             .join(Block, Block.id == Transaction.block_id)
+             .filter(Block.index > start_index, Block.index <= tip_index,
+                     Transaction.transaction_type.in_(PROJECTED_TYPES))
+             .order_by(Transaction.id.asc()))
+    _replay(mined, users, batch_size)
+
+    if include_pending:
+        pending = (db.session.query(PendingTransaction.transaction_type, PendingTransaction.data)
+                   .filter(PendingTransaction.transaction_type.in_(PROJECTED_TYPES))
+                   .order_by(PendingTransaction.id.asc()))
+        _replay(pending, users, batch_size)
+
+    return users, start_index, tip_index
+
+def save_snapshot(users, block_index):
+    """Store users as the projection at block_index and prune older snapshots"""
+    block = Block.query.filter_by(index=block_index).first()
+    snapshot = ProjectionSnapshot(block_index=block_index, block_hash=block.hash,
+                                  users=json.dumps(users), created_at=time.time())
+    db.session.add(snapshot)
+    db.session.flush()
+
+    stale_ids = [snapshot_id for snapshot_id, in (db.session.query(ProjectionSnapshot.id)
+                                                  .order_by(ProjectionSnapshot.block_index.desc(),
+                                                            ProjectionSnapshot.id.desc())
+                                                  .offset(SNAPSHOTS_KEPT))]
+    if stale_ids:
+        ProjectionSnapshot.query.filter(ProjectionSnapshot.id.in_(stale_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return snapshot
+
+def catch_up():
+    """Snapshot the projection at the tip once PROJECTION_SNAPSHOT_INTERVAL blocks have been mined since the last one.
+
+    Returns the new snapshot, or None if the last one is recent enough.
+    """
+    snapshot = latest_snapshot()
+    tip = Blockchain.get_latest_block()
+    if not tip:
+        return None
+    if snapshot and tip.index - snapshot.block_index < current_app.config['PROJECTION_SNAPSHOT_INTERVAL']:
+        return None
+
+    users, _, tip_index = project()
+    return save_snapshot(users, tip_index)
+
+def find_drift(full=False):
+    """Compare User counters with the ledger projection, mempool included.
+
+    Returns (drift, start_index, tip_index), where drift lists
+    (user_id, stored, projected) for every user whose
+    (block_balance, wins, losses) disagree; stored is None for users only
+    the ledger knows about.
+    """
+    users, start_index, tip_index = project(full=full, include_pending=True)
+    drift = []
+    for user_id, balance, wins, losses in db.session.query(User.id, User.block_balance, User.wins, User.losses):
+        projected = tuple(users.pop(user_id, (0, 0, 0)))
+        if (balance, wins, losses) != projected:
+            drift.append((user_id, (balance, wins, losses), projected))
+    for user_id, projected in sorted(users.items()):
+        if any(projected):
+            drift.append((user_id, None, tuple(projected)))
+    return drift, start_index, tip_index
@@ -3,12 +3,18 @@ import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_user, logout_user, current_user
 from models import db, User
-from blockchain import Blockchain
+import ledger
+import passwords
 
 auth = Blueprint('auth', __name__)
 
 DEFAULT_SIGNUP_PASSWORD = os.environ.get('DEFAULT_SIGNUP_PASSWORD')
 
+def _hashing_busy(template):
+    """503 page for when every password hashing slot is taken"""
+    flash('The server is busy right now. Please try again in a moment.', 'warning')
+    return render_template(template), 503, {'Retry-After': '1'}
+
 @auth.route('/access', methods=['GET', 'POST'])
 def access_page():
     if session.get('has_passed_gate') or current_user.is_authenticated:
@@ -51,18 +57,23 @@ def register():
             flash('Email address already registered.', 'warning')
             return redirect(url_for('auth.register'))
 
-        new_user = User(name=name, email=email)
-        new_user.set_password(password)
-        db.session.add(new_user)
-        db.session.commit()
-        
-        # Add blockchain transaction for user registration
-        user_data = {
-            'name': name,
-            'email': email,
-            'registration_time': datetime.datetime.now().isoformat()
-        }
-        Blockchain.add_transaction('user_registration', user_id=new_user.id, data=user_data)
+        try:
+            password_hash = passwords.hash_password(password)
+        except passwords.HashingBusy:
+            return _hashing_busy('register.html')
+
+        new_user = User(name=name, email=email, password_hash=password_hash)
+        with ledger.record() as entries:
+            db.session.add(new_user)
+            db.session.flush()  # Get the user ID
+
+            # Add blockchain transaction for user registration
+            user_data = {
+                'name': name,
+                'email': email,
+                'registration_time': datetime.datetime.now().isoformat()
+            }
+            entries.add('user_registration', user_id=new_user.id, data=user_data)
         
         session.pop('has_passed_gate', None) # Clear gate pass after registration
         flash('Registration successful! Please log in.', 'success')
@@ -77,7 +88,18 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         user = User.query.filter_by(email=email).first()
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and passwords.verify_password(password, user.password_hash)
+        except passwords.HashingBusy:
+            return _hashing_busy('login.html')
+        if valid:
+            if passwords.needs_rehash(user.password_hash):
+                # BCRYPT_ROUNDS changed since this hash was made; upgrade it while we have the password
+                try:
+                    user.password_hash = passwords.hash_password(password)
+                    db.session.commit()
+                except passwords.HashingBusy:
+                    pass  # Try again on the next login
             login_user(user)
             session.pop('has_passed_gate', None) # Clear gate pass after successful login
             flash('Logged in successfully!', 'success')
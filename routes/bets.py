@@ -1,8 +1,12 @@
 import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_required, current_user
-from models import db, User, Bet, UserBet
+from models import db, Bet, UserBet
+import ledger
 from blockchain import Blockchain
+from bet_stats import get_bet_statistics, increment_tally
+from settlement import settle_bet
+from cache import cached, invalidate
 
 bets = Blueprint('bets', __name__)
 
@@ -38,19 +42,21 @@ def create_bet():
             outcomes=','.join(outcomes_list),
             creator_id=current_user.id
         )
-        db.session.add(new_bet)
-        db.session.commit()
-        
-        # Add blockchain transaction for bet creation
-        bet_data = {
-            'title': title,
-            'description': description,
-            'expiration_date': expiration_date.isoformat(),
-            'outcomes': outcomes_list,
-            'creator_id': current_user.id,
-            'creation_time': datetime.datetime.now().isoformat()
-        }
-        Blockchain.add_transaction('bet_creation', user_id=current_user.id, bet_id=new_bet.id, data=bet_data)
+        with ledger.record() as entries:
+            db.session.add(new_bet)
+            db.session.flush()  # Get the bet ID
+
+            # Add blockchain transaction for bet creation
+            bet_data = {
+                'title': title,
+                'description': description,
+                'expiration_date': expiration_date.isoformat(),
+                'outcomes': outcomes_list,
+                'creator_id': current_user.id,
+                'creation_time': datetime.datetime.now().isoformat()
+            }
+            entries.add('bet_creation', user_id=current_user.id, bet_id=new_bet.id, data=bet_data)
+        invalidate('bets')
         
         flash('Bet created successfully!', 'success')
         return redirect(url_for('main.index'))
@@ -77,19 +83,21 @@ def place_bet(bet_id):
         flash('You have already placed a bet on this item.', 'warning')
         return redirect(url_for('main.index'))
 
-    new_user_bet = UserBet(user_id=current_user.id, bet_id=bet_id, chosen_outcome=chosen_outcome)
-    db.session.add(new_user_bet)
-    db.session.commit()
-    
-    # Add blockchain transaction for bet placement
-    bet_placement_data = {
-        'user_id': current_user.id,
-        'bet_id': bet_id,
-        'chosen_outcome': chosen_outcome,
-        'bet_title': bet.title,
-        'placement_time': datetime.datetime.now().isoformat()
-    }
-    Blockchain.add_transaction('bet_placement', user_id=current_user.id, bet_id=bet_id, data=bet_placement_data)
+    with ledger.record() as entries:
+        new_user_bet = UserBet(user_id=current_user.id, bet_id=bet_id, chosen_outcome=chosen_outcome)
+        db.session.add(new_user_bet)
+        increment_tally(bet_id, chosen_outcome)
+
+        # Add blockchain transaction for bet placement
+        bet_placement_data = {
+            'user_id': current_user.id,
+            'bet_id': bet_id,
+            'chosen_outcome': chosen_outcome,
+            'bet_title': bet.title,
+            'placement_time': datetime.datetime.now().isoformat()
+        }
+        entries.add('bet_placement', user_id=current_user.id, bet_id=bet_id, data=bet_placement_data)
+    invalidate('bets', f'bet:{bet_id}')
     
     flash(f'You have successfully bet on "{chosen_outcome}"!', 'success')
     return redirect(url_for('bets.bet_details', bet_id=bet_id))
@@ -110,56 +118,16 @@ def resolve_bet(bet_id):
         flash('Invalid winning outcome selected.', 'danger')
         return redirect(url_for('main.index'))
 
-    bet.resolved = True
-    bet.winning_outcome = winning_outcome
-
-    # Update win/loss records and award blocks to winners
-    winners = []
-    losers = []
-    total_participants = bet.user_bets.count()
-    blocks_per_winner = max(1, total_participants // 2)  # Award more blocks for more competitive bets
-    
-    for user_bet_record in bet.user_bets:
-        user = User.query.get(user_bet_record.user_id)
-        if user:
-            if user_bet_record.chosen_outcome == winning_outcome:
-                user.wins = (user.wins or 0) + 1
-                user.block_balance = (user.block_balance or 0) + blocks_per_winner
-                winners.append({'user_id': user.id, 'name': user.name, 'chosen_outcome': user_bet_record.chosen_outcome, 'blocks_earned': blocks_per_winner})
-            else:
-                user.losses = (user.losses or 0) + 1
-                losers.append({'user_id': user.id, 'name': user.name, 'chosen_outcome': user_bet_record.chosen_outcome})
-
-    db.session.commit()
-    
-    # Add blockchain transactions for block rewards
-    for winner in winners:
-        reward_data = {
-            'bet_id': bet_id,
-            'bet_title': bet.title,
-            'winner_id': winner['user_id'],
-            'blocks_awarded': winner['blocks_earned'],
-            'total_participants': total_participants,
-            'reward_time': datetime.datetime.now().isoformat()
-        }
-        Blockchain.add_transaction('block_reward', user_id=winner['user_id'], bet_id=bet_id, data=reward_data)
-    
-    # Add blockchain transaction for bet resolution
-    resolution_data = {
-        'bet_id': bet_id,
-        'bet_title': bet.title,
-        'winning_outcome': winning_outcome,
-        'resolver_id': current_user.id,
-        'winners': winners,
-        'losers': losers,
-        'resolution_time': datetime.datetime.now().isoformat()
-    }
-    Blockchain.add_transaction('bet_resolution', user_id=current_user.id, bet_id=bet_id, data=resolution_data)
+    if settle_bet(bet, winning_outcome, current_user.id) is None:
+        flash('This bet has already been resolved.', 'warning')
+        return redirect(url_for('main.index'))
+    invalidate('bets', f'bet:{bet_id}', 'leaderboard')
     
     flash(f'Bet "{bet.title}" resolved. Winning outcome: {winning_outcome}', 'success')
     return redirect(url_for('bets.bet_details', bet_id=bet_id))
 
 @bets.route('/bet/<int:bet_id>')
+@cached('bet:{bet_id}', vary=Blockchain.get_tip_hash)  # The audit trail grows as blocks are mined
 def bet_details(bet_id):
     if not current_user.is_authenticated and not session.get('has_passed_gate'):
         return redirect(url_for('auth.access_page'))
@@ -167,31 +135,24 @@ def bet_details(bet_id):
     bet = Bet.query.get_or_404(bet_id)
     
     # Calculate detailed statistics
-    user_bets_on_this = UserBet.query.filter_by(bet_id=bet_id).all()
-    outcome_counts = {outcome: 0 for outcome in bet.get_outcomes_list()}
-    total_bets_on_this_bet = len(user_bets_on_this)
-    users_by_outcome = {outcome: [] for outcome in bet.get_outcomes_list()}
-    
-    for user_bet in user_bets_on_this:
-        if user_bet.chosen_outcome in outcome_counts:
-            outcome_counts[user_bet.chosen_outcome] += 1
-        user = User.query.get(user_bet.user_id)
-        if user and user_bet.chosen_outcome in users_by_outcome:
-            users_by_outcome[user_bet.chosen_outcome].append(user)
-    
-    outcome_percentages = {}
-    if total_bets_on_this_bet > 0:
-        for outcome, count in outcome_counts.items():
-            outcome_percentages[outcome] = (count / total_bets_on_this_bet) * 100
-    else:
-        for outcome in bet.get_outcomes_list():
-            outcome_percentages[outcome] = 0
+    stats = get_bet_statistics([bet])[bet.id]
     
     # Check if current user has placed a bet
     user_bet = None
     if current_user.is_authenticated:
         user_bet = UserBet.query.filter_by(user_id=current_user.id, bet_id=bet_id).first()
     
+    # Ledger entries for this bet, newest first
+    audit_rows, audit_has_more = Blockchain.find_transactions(
+        bet_id=bet_id, before=request.args.get('audit_before', type=int), limit=10)
+    audit_trail = [{
+        'id': tx.id,
+        'hash': tx.hash,
+        'type': tx.transaction_type,
+        'block_index': block_index,
+        'timestamp': datetime.datetime.fromtimestamp(tx.timestamp)
+    } for tx, block_index in audit_rows]
+    
     # Calculate time remaining
     time_remaining = None
     if not bet.resolved and bet.expiration_date > datetime.datetime.now():
@@ -199,11 +160,13 @@ def bet_details(bet_id):
     
     bet_data = {
         'bet': bet,
-        'outcome_counts': outcome_counts,
-        'outcome_percentages': outcome_percentages,
-        'users_by_outcome': users_by_outcome,
-        'total_bets': total_bets_on_this_bet,
+        'outcome_counts': stats['outcome_counts'],
+        'outcome_percentages': stats['outcome_percentages'],
+        'users_by_outcome': stats['users_by_outcome'],
+        'total_bets': stats['total_bets'],
         'user_bet': user_bet,
+        'audit_trail': audit_trail,
+        'audit_has_more': audit_has_more,
         'time_remaining': time_remaining,
         'is_expired': datetime.datetime.now() > bet.expiration_date,
         'can_bet': (current_user.is_authenticated and 
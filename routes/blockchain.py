@@ -1,26 +1,72 @@
 import json
 import datetime
-from flask import Blueprint, render_template, redirect, url_for, session, jsonify
+from flask import Blueprint, render_template, redirect, url_for, session, jsonify, request, Response, stream_with_context
 from flask_login import current_user
 from models import Block, Transaction
 from blockchain import Blockchain
+from cache import cached
 
 blockchain_bp = Blueprint('blockchain', __name__)
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def _load_block_page(newest_first):
+    """Load one page of blocks using the ?before=, ?after= and ?limit= cursors.
+
+    Returns the blocks in chain order (oldest first), a dict of their
+    transactions keyed by block id, and whether more blocks exist past the
+    page in the direction it was read.
+    """
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = Block.query
+    if after is not None:
+        query = query.filter(Block.index > after).order_by(Block.index.asc())
+    elif before is not None:
+        query = query.filter(Block.index < before).order_by(Block.index.desc())
+    elif newest_first:
+        query = query.order_by(Block.index.desc())
+    else:
+        query = query.order_by(Block.index.asc())
+
+    blocks = query.limit(limit + 1).all()
+    has_more = len(blocks) > limit
+    blocks = sorted(blocks[:limit], key=lambda block: block.index)
+
+    transactions_by_block = {block.id: [] for block in blocks}
+    if blocks:
+        page_transactions = (Transaction.query
+                             .filter(Transaction.block_id.in_(transactions_by_block))
+                             .order_by(Transaction.id.asc())
+                             .all())
+        for tx in page_transactions:
+            transactions_by_block[tx.block_id].append(tx)
+
+    return blocks, transactions_by_block, has_more, limit
+
+def _chain_length():
+    latest_block = Blockchain.get_latest_block()
+    return latest_block.index + 1 if latest_block else 0
+
 @blockchain_bp.route('/blockchain')
+@cached(vary=Blockchain.get_tip_hash)
 def blockchain_explorer():
     if not current_user.is_authenticated and not session.get('has_passed_gate'):
         return redirect(url_for('auth.access_page'))
-    
-    blocks = Block.query.order_by(Block.index.desc()).all()
+
+    blocks, transactions_by_block, has_more, limit = _load_block_page(newest_first=True)
     chain_valid = Blockchain.validate_chain()
-    
+    total_blocks = _chain_length()
+
     block_data = []
-    for block in blocks:
-        transactions = Transaction.query.filter_by(block_id=block.id).all()
+    for block in reversed(blocks):
         transaction_data = []
-        
-        for tx in transactions:
+
+        for tx in transactions_by_block[block.id]:
             tx_data = {
                 'hash': tx.hash,
                 'type': tx.transaction_type,
@@ -30,7 +76,7 @@ def blockchain_explorer():
                 'timestamp': datetime.datetime.fromtimestamp(tx.timestamp)
             }
             transaction_data.append(tx_data)
-        
+
         block_info = {
             'block': block,
             'transactions': transaction_data,
@@ -38,26 +84,41 @@ def blockchain_explorer():
             'timestamp': datetime.datetime.fromtimestamp(block.timestamp)
         }
         block_data.append(block_info)
-    
-    return render_template('blockchain.html', 
-                         block_data=block_data, 
+
+    # Newer blocks exist unless this page reaches the tip; older ones unless it reaches genesis
+    newer_url = None
+    older_url = None
+    if blocks:
+        if blocks[-1].index < total_blocks - 1:
+            newer_url = url_for('blockchain.blockchain_explorer', after=blocks[-1].index, limit=limit)
+        if blocks[0].index > 0:
+            older_url = url_for('blockchain.blockchain_explorer', before=blocks[0].index, limit=limit)
+
+    return render_template('blockchain.html',
+                         block_data=block_data,
                          chain_valid=chain_valid,
-                         total_blocks=len(blocks))
+                         total_blocks=total_blocks,
+                         newer_url=newer_url,
+                         older_url=older_url)
 
 @blockchain_bp.route('/api/blockchain')
 def api_blockchain():
-    """API endpoint for blockchain data"""
+    """API endpoint for blockchain data, one page of blocks at a time.
+
+    Without a cursor the first page starts at genesis. To follow the tip,
+    keep requesting ?after=<cursor.next_after>; the cursor stays put while
+    no new blocks have been mined.
+    """
     if not current_user.is_authenticated and not session.get('has_passed_gate'):
         return jsonify({'error': 'Access denied'}), 403
-    
-    blocks = Block.query.order_by(Block.index.asc()).all()
+
+    blocks, transactions_by_block, has_more, limit = _load_block_page(newest_first=False)
     chain_data = []
-    
+
     for block in blocks:
-        transactions = Transaction.query.filter_by(block_id=block.id).all()
         tx_data = []
-        
-        for tx in transactions:
+
+        for tx in transactions_by_block[block.id]:
             tx_info = {
                 'hash': tx.hash,
                 'type': tx.transaction_type,
@@ -67,7 +128,7 @@ def api_blockchain():
                 'timestamp': tx.timestamp
             }
             tx_data.append(tx_info)
-        
+
         block_info = {
             'index': block.index,
             'timestamp': block.timestamp,
@@ -78,9 +139,79 @@ def api_blockchain():
             'transactions': tx_data
         }
         chain_data.append(block_info)
-    
+
+    after = request.args.get('after', type=int)
     return jsonify({
         'blockchain': chain_data,
         'valid': Blockchain.validate_chain(),
-        'length': len(chain_data)
-    })
\ No newline at end of file
+        'length': _chain_length(),
+        'cursor': {
+            'limit': limit,
+            'has_more': has_more,
+            'next_after': blocks[-1].index if blocks else after,
+            'prev_before': blocks[0].index if blocks else None
+        }
+    })
+
+@blockchain_bp.route('/api/blockchain/export')
+def api_blockchain_export():
+    """Stream the whole chain as NDJSON, one block per line"""
+    if not current_user.is_authenticated and not session.get('has_passed_gate'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    return Response(
+        stream_with_context(Blockchain.export_ndjson()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=blockchain.ndjson'}
+    )
+
+@blockchain_bp.route('/api/transactions')
+def api_transactions():
+    """Look up ledger transactions by ?user_id=, ?bet_id= and ?type=, newest first.
+
+    Follow cursor.next_before with ?before= to page back through history.
+    """
+    if not current_user.is_authenticated and not session.get('has_passed_gate'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    rows, has_more = Blockchain.find_transactions(
+        user_id=request.args.get('user_id', type=int),
+        bet_id=request.args.get('bet_id', type=int),
+        transaction_type=request.args.get('type'),
+        before=request.args.get('before', type=int),
+        limit=limit
+    )
+
+    return jsonify({
+        'transactions': [{
+            'id': tx.id,
+            'hash': tx.hash,
+            'type': tx.transaction_type,
+            'user_id': tx.user_id,
+            'bet_id': tx.bet_id,
+            'block_index': block_index,
+            'data': json.loads(tx.data),
+            'timestamp': tx.timestamp
+        } for tx, block_index in rows],
+        'cursor': {
+            'limit': limit,
+            'has_more': has_more,
+            'next_before': rows[-1][0].id if rows else None
+        }
+    })
+
+@blockchain_bp.route('/api/tx/<tx_hash>/proof')
+def api_transaction_proof(tx_hash):
+    """Merkle inclusion proof for one mined transaction.
+
+    Check it offline with merkle.verify_proof(tx_hash, path, merkle_root) and
+    compare merkle_root and block_hash against a trusted copy of the header.
+    """
+    if not current_user.is_authenticated and not session.get('has_passed_gate'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    proof = Blockchain.merkle_proof(tx_hash)
+    if proof is None:
+        return jsonify({'error': 'Transaction not found in a mined block'}), 404
+    return jsonify(proof)
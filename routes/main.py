@@ -1,56 +1,75 @@
-from flask import Blueprint, render_template, redirect, url_for, session
+from flask import Blueprint, render_template, redirect, url_for, session, request, jsonify, current_app
 from flask_login import login_required, current_user
-from models import User, Bet, UserBet
+from sqlalchemy.orm import joinedload
+from models import Bet
+from bet_stats import get_bet_statistics, get_user_outcomes
+from leaderboard import leaderboard_cache
+from cache import cached
 
 main = Blueprint('main', __name__)
 
 @main.route('/')
+@cached('bets')
 def index():
     if not current_user.is_authenticated and not session.get('has_passed_gate'):
         return redirect(url_for('auth.access_page'))
 
-    active_bets = Bet.query.filter_by(resolved=False).order_by(Bet.expiration_date.desc()).all()
-    resolved_bets = Bet.query.filter_by(resolved=True).order_by(Bet.expiration_date.desc()).all()
+    active_bets = (Bet.query.options(joinedload(Bet.creator))
+                   .filter_by(resolved=False).order_by(Bet.expiration_date.desc()).all())
+    resolved_bets = (Bet.query.options(joinedload(Bet.creator))
+                     .filter_by(resolved=True).order_by(Bet.expiration_date.desc()).all())
+    all_bets = active_bets + resolved_bets
 
-    bet_data = []
-    for bet in active_bets + resolved_bets:
-        outcome_counts = {outcome: 0 for outcome in bet.get_outcomes_list()}
-        total_bets_on_this_bet = 0
-        user_bets_on_this = UserBet.query.filter_by(bet_id=bet.id).all()
-        users_who_betted = []
-
-        for user_bet in user_bets_on_this:
-            if user_bet.chosen_outcome in outcome_counts:
-                outcome_counts[user_bet.chosen_outcome] += 1
-            total_bets_on_this_bet += 1
-            user_b = User.query.get(user_bet.user_id)
-            if user_b:
-                 users_who_betted.append(user_b.name)
-
-        outcome_percentages = {}
-        if total_bets_on_this_bet > 0:
-            for outcome, count in outcome_counts.items():
-                outcome_percentages[outcome] = (count / total_bets_on_this_bet) * 100
-        else:
-            for outcome in bet.get_outcomes_list():
-                outcome_percentages[outcome] = 0
+    bet_stats = get_bet_statistics(all_bets, include_bettors=False)
+    user_outcomes = get_user_outcomes(current_user.id, all_bets) if current_user.is_authenticated else {}
 
+    bet_data = []
+    for bet in all_bets:
+        stats = bet_stats[bet.id]
         bet_data.append({
             'bet': bet,
-            'outcome_percentages': outcome_percentages,
-            'users_who_betted': list(set(users_who_betted)),
-            'total_bets_on_this_bet': total_bets_on_this_bet
+            'outcome_percentages': stats['outcome_percentages'],
+            'total_bets_on_this_bet': stats['total_bets'],
+            'current_user_outcome': user_outcomes.get(bet.id)
         })
     return render_template('index.html', bet_data=bet_data)
 
 @main.route('/leaderboard')
 @login_required # Or remove @login_required if leaderboard should be public (after gatekeeper)
+@cached('leaderboard')
 def leaderboard():
     if not current_user.is_authenticated and not session.get('has_passed_gate'):
         return redirect(url_for('auth.access_page')) # Protect leaderboard if not logged in
-        
-    users = User.query.order_by(User.wins.desc(), User.losses.asc()).all()
-    return render_template('leaderboard.html', users=users)
+
+    page, per_page = _leaderboard_page_args()
+    entries, total = leaderboard_cache.page((page - 1) * per_page, per_page)
+    return render_template('leaderboard.html',
+                         entries=entries,
+                         page=page,
+                         per_page=per_page,
+                         total_pages=max(1, -(-total // per_page)),
+                         total_users=total,
+                         my_rank=leaderboard_cache.rank(current_user))
+
+@main.route('/api/leaderboard')
+def api_leaderboard():
+    """One page of the leaderboard, plus the caller's rank when logged in"""
+    if not current_user.is_authenticated and not session.get('has_passed_gate'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    page, per_page = _leaderboard_page_args()
+    entries, total = leaderboard_cache.page((page - 1) * per_page, per_page)
+    return jsonify({
+        'leaderboard': entries,
+        'page': page,
+        'per_page': per_page,
+        'total_users': total,
+        'my_rank': leaderboard_cache.rank(current_user) if current_user.is_authenticated else None
+    })
+
+def _leaderboard_page_args():
+    per_page = request.args.get('per_page', current_app.config['LEADERBOARD_PAGE_SIZE'], type=int)
+    return max(1, request.args.get('page', 1, type=int)), max(1, min(per_page, 100))
 
 @main.route('/privacy-policy')
 def privacy_policy():
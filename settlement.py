@@ -0,0 +1,84 @@
+import datetime
+from models import db, User, Bet, UserBet
+import ledger
+from leaderboard import leaderboard_cache
+from identity import invalidate_users
+
+def settle_bet(bet, winning_outcome, resolver_id):
+    """Resolve a bet and pay its winners in a single database transaction.
+
+    Winners and losers are each updated with one set-based UPDATE, and the
+    payouts are recorded as one compact block_reward transaction next to the
+    bet_resolution transaction, all inside one ledger.record() commit. The
+    participants' cached snapshots are then dropped and they are re-ranked
+    on the leaderboard.
+    Returns a summary dict, or None if the bet was resolved by someone else
+    first.
+    """
+    with ledger.record() as entries:
+        resolved = (Bet.query
+                    .filter_by(id=bet.id, resolved=False)
+                    .update({'resolved': True, 'winning_outcome': winning_outcome}, synchronize_session=False))
+        if not resolved:
+            return None
+
+        participants = (db.session.query(UserBet.user_id, User.name, UserBet.chosen_outcome)
+                        .join(User, User.id == UserBet.user_id)
+                        .filter(UserBet.bet_id == bet.id)
+                        .order_by(UserBet.id.asc())
+                        .all())
+        total_participants = len(participants)
+        blocks_per_winner = max(1, total_participants // 2)  # Award more blocks for more competitive bets
+
+        winner_ids = db.session.query(UserBet.user_id).filter(UserBet.bet_id == bet.id,
+                                                              UserBet.chosen_outcome == winning_outcome)
+        loser_ids = db.session.query(UserBet.user_id).filter(UserBet.bet_id == bet.id,
+                                                             UserBet.chosen_outcome != winning_outcome)
+        User.query.filter(User.id.in_(winner_ids.scalar_subquery())).update({
+            'wins': User.wins + 1,
+            'block_balance': User.block_balance + blocks_per_winner
+        }, synchronize_session=False)
+        User.query.filter(User.id.in_(loser_ids.scalar_subquery())).update({
+            'losses': User.losses + 1
+        }, synchronize_session=False)
+
+        winners = []
+        losers = []
+        for user_id, name, chosen_outcome in participants:
+            if chosen_outcome == winning_outcome:
+                winners.append({'user_id': user_id, 'name': name, 'chosen_outcome': chosen_outcome, 'blocks_earned': blocks_per_winner})
+            else:
+                losers.append({'user_id': user_id, 'name': name, 'chosen_outcome': chosen_outcome})
+
+        if winners:
+            reward_data = {
+                'bet_id': bet.id,
+                'bet_title': bet.title,
+                'blocks_per_winner': blocks_per_winner,
+                'total_participants': total_participants,
+                'payouts': [{'user_id': winner['user_id'], 'blocks': blocks_per_winner} for winner in winners],
+                'reward_time': datetime.datetime.now().isoformat()
+            }
+            entries.add('block_reward', user_id=resolver_id, bet_id=bet.id, data=reward_data)
+
+        resolution_data = {
+            'bet_id': bet.id,
+            'bet_title': bet.title,
+            'winning_outcome': winning_outcome,
+            'resolver_id': resolver_id,
+            'winners': winners,
+            'losers': losers,
+            'resolution_time': datetime.datetime.now().isoformat()
+        }
+        entries.add('bet_resolution', user_id=resolver_id, bet_id=bet.id, data=resolution_data)
+
+    participant_ids = [user_id for user_id, _, _ in participants]
+    invalidate_users(participant_ids)
+    leaderboard_cache.refresh_users(participant_ids)
+
+    return {
+        'winners': winners,
+        'losers': losers,
+        'blocks_per_winner': blocks_per_winner,
+        'total_participants': total_participants
+    }
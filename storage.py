@@ -0,0 +1,44 @@
+from sqlalchemy import event
+from models import db
+
+def apply_sqlite_pragmas(dbapi_connection, config):
+    """Set the SQLite pragmas from config on a raw DB-API connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute(f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+        cursor.execute(f"PRAGMA cache_size = {int(config['SQLITE_CACHE_SIZE'])}")
+    finally:
+        cursor.close()
+
+def upsert(model, values, index_elements, set_):
+    """INSERT values into model's table, or apply set_ to the row that conflicts on index_elements.
+
+    A single statement, so concurrent first writes of the same key cannot
+    both insert. Covers the databases DATABASE_URL supports, SQLite and
+    PostgreSQL.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model.__table__).values(**values).on_conflict_do_update(index_elements=index_elements, set_=set_)
+
+def is_database_locked(error):
+    """Whether a DBAPI error is SQLite giving up on a lock after busy_timeout"""
+    return 'database is locked' in str(getattr(error, 'orig', error))
+
+def init_storage(app):
+    """Hook the configured SQLite pragmas onto the app's engine"""
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+
+        config = app.config
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, config)